@@ -1,13 +1,16 @@
 import os
-import json
-import requests
 import shutil
 import subprocess
 from typing import List, Optional
 
+# ใช้ client ตัวเดียวกับ apps/back2 (connection pool, retry, circuit breaker, keep_alive) จาก packages/ollama-client
+from ollama_client import OllamaClient
+
 MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:latest")
 URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
 
+client = OllamaClient(hosts=URL.split("/api/")[0])
+
 
 def list_models() -> List[str]:
     """Return a list of model names available to the local Ollama installation.
@@ -39,36 +42,13 @@ def generate_text(prompt: str, model: Optional[str] = None, timeout: int = 30) -
     """Generate text using local Ollama HTTP API.
 
     - `model` overrides the `OLLAMA_MODEL` env var if provided.
-    - Returns concatenated streaming response (handles NDJSON stream).
+    - Goes through the shared pooled client; errors come back as text.
     """
     use_model = model or os.environ.get("OLLAMA_MODEL", MODEL)
-    payload = {"model": use_model, "prompt": prompt}
     try:
-        r = requests.post(URL, json=payload, stream=True, timeout=timeout)
+        # apps/back เป็น process แยก scheduler ของ client นี้จึงเป็นของตัวเอง: ไม่ได้ใช้ slot ที่ apps/back2 จองไว้
+        # และไม่ถูกนับในความเป็นธรรมระหว่าง client ของ apps/back2 (ถ้า Ollama เครื่องเดียวกัน ก็ไปต่อคิวใน Ollama เอง)
+        result = client.generate(prompt, use_model, timeout=timeout)
     except Exception as e:
         return f"error calling ollama: {e}"
-
-    if r.status_code != 200:
-        try:
-            return r.text
-        except Exception:
-            return f"ollama returned status {r.status_code}"
-
-    parts = []
-    try:
-        for raw in r.iter_lines(decode_unicode=True):
-            if not raw:
-                continue
-            try:
-                obj = json.loads(raw)
-            except Exception:
-                continue
-            resp = obj.get("response")
-            if resp:
-                parts.append(resp)
-            if obj.get("done"):
-                break
-    except Exception as e:
-        return f"error reading ollama stream: {e}"
-
-    return "".join(parts)
\ No newline at end of file
+    return result.get("response", "")
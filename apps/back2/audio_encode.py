@@ -0,0 +1,168 @@
+import os
+import struct
+
+# format ที่ส่งได้: (media type, format/subtype ของ soundfile หรือ None = WAV ที่เขียนเอง)
+FORMATS = {
+    "wav": ("audio/wav", None),
+    "flac": ("audio/flac", ("FLAC", "PCM_16")),
+    "ogg": ("audio/ogg", ("OGG", "VORBIS")),
+    "opus": ("audio/ogg; codecs=opus", ("OGG", "OPUS")),
+}
+EXTENSIONS = {"wav": ".wav", "flac": ".flac", "ogg": ".ogg", "opus": ".opus"}
+
+
+def check_format(fmt: str):
+    """Raise ValueError if `fmt` is unknown or its encoder is not installed."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown audio format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    codec = FORMATS[fmt][1]
+    if codec is None:
+        return
+    try:
+        import soundfile
+    except ImportError:
+        raise ValueError(f"Audio format {fmt!r} needs the soundfile package") from None
+    if codec[1] not in soundfile.available_subtypes(codec[0]):
+        raise ValueError(f"libsndfile {soundfile.__libsndfile_version__} cannot write {fmt!r}")
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][0]
+
+
+def wav_stream_header(sample_rate: int) -> bytes:
+    # ยังไม่รู้ความยาว: ใส่ขนาดสูงสุดไว้ ตัวเล่นส่วนใหญ่เล่นไปจนกว่า stream จะจบ
+    unknown = 0xFFFFFFFF
+    return (
+        b"RIFF" + struct.pack("<I", unknown) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", unknown)
+    )
+
+
+class _StreamSink:
+    """Write-only file object for libsndfile that hands out bytes as they are written.
+
+    libsndfile seeks back at close to patch headers (e.g. FLAC STREAMINFO);
+    bytes before what was already sent are dropped, which leaves a valid
+    stream with the total length unknown.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.position = 0
+        self.pending = bytearray()
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        size = len(data)
+        start = self.position - self.sent
+        if start < 0:
+            data = data[-start:]
+            start = 0
+        end = start + len(data)
+        if end > len(self.pending):
+            self.pending.extend(b"\0" * (end - len(self.pending)))
+        self.pending[start:end] = data
+        self.position += size
+        return size
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.sent + len(self.pending)
+        self.position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        return b""
+
+    def take(self) -> bytes:
+        data = bytes(self.pending)
+        self.sent += len(data)
+        self.pending.clear()
+        return data
+
+
+class AudioEncoder:
+    """Encode 16-bit mono PCM incrementally; every call returns bytes ready to send."""
+
+    def __init__(self, fmt: str, sample_rate: int):
+        check_format(fmt)
+        self.fmt = fmt
+        self.sample_rate = sample_rate
+        self._file = None
+        self._sink = None
+        self._header = fmt == "wav"
+
+    def encode(self, pcm: bytes) -> bytes:
+        if FORMATS[self.fmt][1] is None:
+            if self._header:
+                self._header = False
+                return wav_stream_header(self.sample_rate) + pcm
+            return pcm
+        if self._file is None:
+            import soundfile
+
+            container, subtype = FORMATS[self.fmt][1]
+            self._sink = _StreamSink()
+            self._file = soundfile.SoundFile(
+                self._sink, mode="w", samplerate=self.sample_rate, channels=1, format=container, subtype=subtype
+            )
+        self._file.buffer_write(pcm, dtype="int16")
+        # ให้ libsndfile เขียนเท่าที่ encode ได้ลง sink ก่อนส่ง
+        self._file.flush()
+        return self._sink.take()
+
+    def finish(self) -> bytes:
+        if self._file is None:
+            return wav_stream_header(self.sample_rate) if self._header else b""
+        self._file.close()
+        return self._sink.take()
+
+
+def encode_audio(pcm: bytes, fmt: str, sample_rate: int) -> bytes:
+    encoder = AudioEncoder(fmt, sample_rate)
+    return encoder.encode(pcm) + encoder.finish()
+
+
+class AudioFileWriter:
+    """Encode PCM into `path` as it arrives; the file appears only once `close()` finishes it."""
+
+    def __init__(self, path: str, fmt: str, sample_rate: int):
+        self.path = path
+        self.fmt = fmt
+        self.encoder = AudioEncoder(fmt, sample_rate)
+        self.samples = 0
+        self.bytes = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._part = path + ".part"
+        self._file = open(self._part, "wb")
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self.bytes += len(data)
+
+    def write(self, pcm: bytes):
+        self.samples += len(pcm) // 2
+        self._write(self.encoder.encode(pcm))
+
+    def close(self):
+        self._write(self.encoder.finish())
+        if self.fmt == "wav":
+            # เขียนลงไฟล์ได้ย้อนแก้ header: ใส่ความยาวจริงแทนค่า "ไม่รู้ความยาว" ของ stream
+            self._file.seek(4)
+            self._file.write(struct.pack("<I", self.bytes - 8))
+            self._file.seek(40)
+            self._file.write(struct.pack("<I", self.samples * 2))
+        self._file.close()
+        os.replace(self._part, self.path)
+
+    def discard(self):
+        self._file.close()
+        os.unlink(self._part)
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ollama import MODEL, serve  # noqa: E402
+from ollama_client import OllamaClient  # noqa: E402
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('balance_bench')
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+async def run_calls(client: OllamaClient, calls: int, concurrency: int, on_half=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+    errors = 0
+
+    async def one(i):
+        nonlocal done, errors
+        async with semaphore:
+            try:
+                await client.agenerate(f"Input: page {i}\n", MODEL, preset="header", timeout=30)
+            except Exception as e:
+                errors += 1
+                logger.warning('call %d failed: %s', i, e)
+            done += 1
+            if on_half is not None and done == calls // 2:
+                on_half()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return time.perf_counter() - started, errors
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Throughput of OllamaClient against 1..N stub Ollama instances')
+    parser.add_argument('--instances', type=int, default=4, help='Largest number of stub instances')
+    parser.add_argument('--base-port', type=int, default=11500)
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds per generate call on a stub')
+    parser.add_argument('--parallel', type=int, default=2, help='Calls each stub serves at once')
+    parser.add_argument('--calls', type=int, default=80)
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.instances)]
+    servers = [serve(port, args.latency, parallel=args.parallel) for port in ports]
+
+    print(f"{'instances':>9} {'calls':>6} {'seconds':>8} {'calls/s':>8} {'errors':>6}")
+    for count in range(1, args.instances + 1):
+        client = OllamaClient([f"http://127.0.0.1:{port}" for port in ports[:count]], retries=1, backoff=0.05)
+        await client.acheck_health()
+        # concurrency เท่ากับจำนวน slot ทั้งหมด เหมือน OLLAMA_CONCURRENCY ต่อเครื่องใน main.py
+        seconds, errors = await run_calls(client, args.calls, count * args.parallel)
+        print(f"{count:>9} {args.calls:>6} {seconds:>8.2f} {args.calls / seconds:>8.1f} {errors:>6}")
+        await client.aclose()
+
+    # failover: instance แรกล่มตอนทำไปครึ่งหนึ่ง งานที่เหลือต้องย้ายไปเครื่องอื่นโดยไม่ error
+    if args.instances > 1:
+        def crash():
+            servers[0].RequestHandlerClass.down = True
+
+        client = OllamaClient([f"http://127.0.0.1:{port}" for port in ports], retries=1, backoff=0.05)
+        seconds, errors = await run_calls(client, args.calls, args.instances * args.parallel, on_half=crash)
+        print(f"failover: {args.calls} calls in {seconds:.2f}s with instance {ports[0]} stopped halfway, {errors} errors")
+        for node in client.status():
+            print(f"  {node['host']}: {node['requests']} requests, {node['errors']} errors, circuit {node['circuit']}")
+        await client.aclose()
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_extract import BACKENDS, PdfExtractor, shutdown_pool  # noqa: E402
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('extract_bench')
+
+
+def run_once(pdf_path: str, backend: str, processes: int, headers: bool):
+    started = time.perf_counter()
+    pdf = PdfExtractor(pdf_path, backend=backend, processes=processes)
+    try:
+        chars = 0
+        for _, text, header_text in pdf.iter_extract(range(1, pdf.page_count + 1), header=headers):
+            chars += len(text or '') + len(header_text or '')
+        pages = pdf.page_count
+    finally:
+        pdf.close()
+    return pages, chars, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare PDF extraction backends in pages/sec (body text plus header crop, as document ingestion does)')
+    parser.add_argument('--pdf', action='append', required=True, help='PDF to extract (repeatable)')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma separated backends')
+    parser.add_argument('--processes', default=f'1,{os.cpu_count() or 1}', help='Comma separated process counts')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per combination, best one is reported')
+    parser.add_argument('--no-headers', action='store_true', help='Skip the header crop')
+    args = parser.parse_args()
+
+    process_counts = sorted({int(p) for p in args.processes.split(',')})
+    rows = []
+    for pdf_path in args.pdf:
+        for backend in args.backends.split(','):
+            for processes in process_counts:
+                try:
+                    # รอบแรกเป็น warm-up (import, spawn process pool) ไม่นับ
+                    run_once(pdf_path, backend, processes, not args.no_headers)
+                    runs = [run_once(pdf_path, backend, processes, not args.no_headers) for _ in range(args.repeat)]
+                except Exception as e:
+                    logger.error('%s with %s failed: %s', pdf_path, backend, e)
+                    continue
+                pages, chars, seconds = min(runs, key=lambda run: run[2])
+                rows.append((os.path.basename(pdf_path), backend, processes, pages, chars, seconds))
+    shutdown_pool()
+
+    print(f"{'pdf':<24} {'backend':<11} {'procs':>5} {'pages':>6} {'chars':>9} {'seconds':>8} {'pages/s':>9}")
+    for name, backend, processes, pages, chars, seconds in rows:
+        print(f"{name:<24} {backend:<11} {processes:>5} {pages:>6} {chars:>9} {seconds:>8.3f} {pages / seconds:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('fake_ollama')
+
+MODEL = "scb10x/typhoon2.1-gemma3-4b:latest"
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Ollama HTTP API.
+
+    Echoes the page text embedded in the prompt back as the "corrected" text
+    after sleeping for the configured latency, so the backend can be driven
+    without a GPU.
+    """
+    protocol_version = "HTTP/1.1"
+    latency = 0.5
+    slots = threading.BoundedSemaphore(1000)
+    # จำลองเครื่องล่ม: ตัด connection ทิ้งโดยไม่ตอบ
+    down = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self._send_json({"models": [{"name": MODEL}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.down:
+            self.close_connection = True
+            return
+        started = time.perf_counter()
+        # เหมือน OLLAMA_NUM_PARALLEL: งานเกินจำนวน slot ต้องรอคิว
+        with self.slots:
+            time.sleep(self.latency)
+        if self.path.startswith("/api/chat"):
+            messages = payload.get("messages", [])
+            prompt = "\n".join(m.get("content", "") for m in messages)
+            text = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        else:
+            prompt = payload.get("prompt", "")
+            text = json.dumps(_batch_chapters(prompt)) if payload.get("format") else _echo_text(prompt)
+        body = {
+            "model": payload.get("model", MODEL),
+            "done": True,
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            # token/เวลาแบบหยาบ ๆ ให้โค้ดที่อ่าน field เหล่านี้มีค่าให้ใช้ ไม่ได้จำลอง KV cache
+            "prompt_eval_count": len(prompt) // 3 + 1,
+            "prompt_eval_duration": int(self.latency * 0.3 * 1e9),
+            "eval_count": len(text) // 3 + 1,
+            "eval_duration": int(self.latency * 0.7 * 1e9),
+        }
+        if self.path.startswith("/api/chat"):
+            body["message"] = {"role": "assistant", "content": text}
+        else:
+            body["response"] = text
+        self._send_json(body)
+
+
+THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+
+
+def _batch_chapters(prompt: str) -> dict:
+    # Structured header batches: report the first number found on each numbered line.
+    results = []
+    for line in prompt.splitlines():
+        match = re.match(r"(\d+)\. (.*)", line)
+        if match:
+            number = re.search(r"ที\S*\s*([0-9๐-๙]+)", match.group(2))
+            chapter = int(number.group(1).translate(THAI_DIGITS)) if number else None
+            results.append({"line": int(match.group(1)), "chapter": chapter})
+    return {"results": results}
+
+
+def _echo_text(prompt: str) -> str:
+    if "--- my text ---\n" in prompt:
+        text = prompt.split("--- my text ---\n", 1)[1]
+        return text.rsplit("\nOutput ONLY the result.", 1)[0]
+    if "Input: " in prompt:
+        return prompt.split("Input: ", 1)[1].split("\n", 1)[0]
+    return prompt
+
+
+def serve(port: int, latency: float, host: str = "127.0.0.1", parallel: int = 0) -> ThreadingHTTPServer:
+    attrs = {"latency": latency}
+    if parallel:
+        attrs["slots"] = threading.BoundedSemaphore(parallel)
+    handler = type("Handler", (FakeOllamaHandler,), attrs)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run stub Ollama servers for local benchmarks')
+    parser.add_argument('--port', type=int, action='append', help='Port to listen on (repeat for several instances)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds to sleep per generate call')
+    parser.add_argument('--parallel', type=int, default=0, help='Generate calls served at once per instance (0 = unlimited)')
+    args = parser.parse_args()
+
+    servers = []
+    for port in args.port or [11434]:
+        servers.append(serve(port, args.latency, parallel=args.parallel))
+        logger.info('Fake Ollama listening on http://127.0.0.1:%d (latency %.2fs)', port, args.latency)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+import httpx
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('loadtest')
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def probe(client: httpx.AsyncClient, url: str, duration: float, rate: float):
+    """Hit a cheap endpoint at a fixed rate and return the latencies in ms."""
+    latencies = []
+    interval = 1.0 / rate
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return latencies
+
+
+async def big_job(client: httpx.AsyncClient, url: str, pdf_path: str, start: int, end: int):
+    with open(pdf_path, "rb") as f:
+        files = {"file": (pdf_path.rsplit("/", 1)[-1], f.read(), "application/pdf")}
+    started = time.perf_counter()
+    response = await client.post(url + "/process-pdf/", files=files, data={"start": start, "end": end})
+    logger.info('Large job finished: HTTP %d in %.2fs', response.status_code, time.perf_counter() - started)
+
+
+def report(label: str, latencies):
+    logger.info(
+        '%-10s n=%-5d p50=%7.1fms p95=%7.1fms p99=%7.1fms max=%7.1fms',
+        label, len(latencies),
+        statistics.median(latencies) if latencies else 0.0,
+        percentile(latencies, 95), percentile(latencies, 99), max(latencies, default=0.0),
+    )
+
+
+async def main(args):
+    timeout = httpx.Timeout(None)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        idle = await probe(client, args.url + "/", args.duration, args.rate)
+        report('idle', idle)
+
+        jobs = [
+            asyncio.create_task(big_job(client, args.url, args.pdf, args.start, args.end))
+            for _ in range(args.jobs)
+        ]
+        await asyncio.sleep(0.5)  # let the uploads start
+        loaded = await probe(client, args.url + "/", args.duration, args.rate)
+        report('under-load', loaded)
+        await asyncio.gather(*jobs)
+
+    if percentile(loaded, 99) > max(50.0, 5 * percentile(idle, 99)):
+        logger.warning('p99 latency grew under load: the event loop is probably being blocked')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measure GET / latency while large /process-pdf/ jobs are running'
+    )
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--pdf', default='sample.pdf')
+    parser.add_argument('--start', type=int, default=1)
+    parser.add_argument('--end', type=int, default=20)
+    parser.add_argument('--jobs', type=int, default=2, help='Concurrent large uploads')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to probe in each phase')
+    parser.add_argument('--rate', type=float, default=20.0, help='Probe requests per second')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
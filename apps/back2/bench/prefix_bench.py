@@ -0,0 +1,81 @@
+import argparse
+import logging
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prompts  # noqa: E402
+import thai_normalizer  # noqa: E402
+from ollama_client import OllamaClient  # noqa: E402
+from pdf_extract import PdfExtractor  # noqa: E402
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('prefix_bench')
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+def load_pages(pdf_path: str, count: int) -> list:
+    pdf = PdfExtractor(pdf_path, processes=1)
+    try:
+        texts = []
+        for _, text, _ in pdf.iter_extract(range(1, pdf.page_count + 1)):
+            if text and text.strip():
+                texts.append(thai_normalizer.normalize_thai(text)[0])
+            if len(texts) >= count:
+                break
+        return texts
+    finally:
+        pdf.close()
+
+
+def call(client: OllamaClient, mode: str, model: str, text: str) -> dict:
+    options = {"num_predict": 16}
+    if mode == "chat":
+        return client.chat(prompts.correction_messages(text), model, preset="correction", options=options, timeout=600)
+    return client.generate(prompts.correction_prompt(text), model, preset="correction", options=options, timeout=600)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare prompt_eval_duration of /api/generate (instructions resent per page) '
+                    'and /api/chat (pinned system message) on real pages'
+    )
+    parser.add_argument('--pdf', required=True, help='Thai PDF to take page texts from')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--host', default=None, help='Ollama host, defaults to OLLAMA_HOSTS/OLLAMA_HOST')
+    parser.add_argument('--model', default='scb10x/typhoon2.1-gemma3-4b:latest')
+    parser.add_argument('--modes', default='generate,chat')
+    args = parser.parse_args()
+
+    texts = load_pages(args.pdf, args.pages)
+    logger.info('Loaded %d pages from %s', len(texts), args.pdf)
+    client = OllamaClient(args.host)
+
+    rows = []
+    for mode in args.modes.split(','):
+        # รอบแรกโหลดโมเดล / เติม cache ไม่นับ; num_predict ต่ำเพื่อวัดเฉพาะช่วง prompt eval
+        call(client, mode, args.model, texts[0])
+        samples = [call(client, mode, args.model, text) for text in texts]
+        prompt_ms = [s.get('prompt_eval_duration', 0) / 1e6 for s in samples]
+        prompt_tokens = [s.get('prompt_eval_count', 0) for s in samples]
+        total_ms = [s.get('total_duration', 0) / 1e6 for s in samples]
+        rows.append((
+            mode,
+            len(samples),
+            statistics.mean(prompt_tokens),
+            statistics.mean(prompt_ms),
+            statistics.median(prompt_ms),
+            sum(prompt_tokens) / (sum(prompt_ms) / 1000) if sum(prompt_ms) else 0.0,
+            statistics.mean(total_ms),
+        ))
+    client.close()
+
+    print(f"{'mode':<9} {'calls':>5} {'prompt tok':>10} {'eval ms':>9} {'p50 ms':>8} {'tok/s':>8} {'total ms':>9}")
+    for mode, calls, tokens, mean_ms, p50_ms, rate, total in rows:
+        print(f"{mode:<9} {calls:>5} {tokens:>10.1f} {mean_ms:>9.1f} {p50_ms:>8.1f} {rate:>8.1f} {total:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
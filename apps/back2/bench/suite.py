@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+
+from fake_ollama import serve  # noqa: E402
+from loadtest import percentile  # noqa: E402
+from synthetic_pdf import build_pdf, generate_pages  # noqa: E402
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('suite')
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+def _status_kb(pid: int, field: str):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _children(pid: int) -> list:
+    pids = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        return []
+    return pids + [grandchild for child in pids for grandchild in _children(child)]
+
+
+def peak_rss_mb(pid: int):
+    """VmHWM of the server plus its extraction worker processes (Linux only, None elsewhere)."""
+    peaks = [_status_kb(p, "VmHWM") for p in [pid] + _children(pid)]
+    if peaks[0] is None:
+        return None
+    return round(sum(p for p in peaks if p) / 1024, 1)
+
+
+class Server:
+    """The back2 app under uvicorn in a subprocess, with fresh cache/document/job stores."""
+
+    def __init__(self, port: int, ollama_url: str, env: dict):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.workdir = tempfile.TemporaryDirectory(prefix="back2-bench-")
+        self.env = {
+            **os.environ,
+            "OLLAMA_HOSTS": ollama_url,
+            "LLM_CACHE_PATH": os.path.join(self.workdir.name, "cache", "llm_cache.sqlite3"),
+            "DOCUMENT_STORE_DIR": os.path.join(self.workdir.name, "documents"),
+            "JOB_STORE_PATH": os.path.join(self.workdir.name, "jobs", "jobs.sqlite3"),
+            **env,
+        }
+        self.process = None
+        self.log = None
+
+    def start(self, timeout: float = 30.0):
+        self.log = open(os.path.join(self.workdir.name, "server.log"), "wb")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=APP_DIR, env=self.env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with code {self.process.returncode}, see {self.log.name}")
+            try:
+                httpx.get(self.url + "/", timeout=1.0)
+                return
+            except httpx.TransportError:
+                time.sleep(0.2)
+        raise RuntimeError(f"server did not start within {timeout}s")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.log is not None:
+            self.log.close()
+        self.workdir.cleanup()
+
+
+async def drive(url: str, endpoint: str, pdfs: list, pages: int, concurrency: int):
+    """Send one request per PDF with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    llm_calls = 0
+
+    if endpoint == "process-pdf":
+        path, data = "/process-pdf/", {"start": 1, "end": pages}
+    else:
+        path, data = "/map-chapters/", {"start_chapter": 1, "end_chapter": 100000}
+
+    async def one(client, index, pdf):
+        nonlocal errors, llm_calls
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(url + path, files={"file": (f"bench-{index}.pdf", pdf, "application/pdf")}, data=data)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors += 1
+            logger.warning('%s request %d failed: HTTP %d %s', endpoint, index, response.status_code, response.text[:200])
+            return
+        llm_calls += response.json().get("stages", {}).get("llm", {}).get("calls", 0)
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(None)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i, pdf) for i, pdf in enumerate(pdfs)))
+        seconds = time.perf_counter() - started
+    return seconds, latencies, errors, llm_calls
+
+
+def run_level(args, endpoint: str, concurrency: int, pdfs: list, ollama_url: str) -> dict:
+    env = {"OLLAMA_CONCURRENCY": str(args.ollama_concurrency)}
+    server = Server(args.port, ollama_url, env)
+    server.start()
+    try:
+        seconds, latencies, errors, llm_calls = asyncio.run(drive(server.url, endpoint, pdfs, args.pages, concurrency))
+        rss = peak_rss_mb(server.process.pid)
+    finally:
+        server.stop()
+    pages = args.pages * (len(pdfs) - errors)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(pdfs),
+        "errors": errors,
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(pages / seconds, 2),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "llm_calls": llm_calls,
+        "peak_rss_mb": rss,
+    }
+
+
+def microbench(args) -> list:
+    # main.py สร้าง cache/document store ตอน import: ชี้ไปที่ temp dir ไม่ให้ไปเขียนทับของจริง
+    workdir = tempfile.mkdtemp(prefix="back2-micro-")
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(workdir, "llm_cache.sqlite3"))
+    os.environ.setdefault("DOCUMENT_STORE_DIR", os.path.join(workdir, "documents"))
+    os.environ.setdefault("JOB_STORE_PATH", os.path.join(workdir, "jobs.sqlite3"))
+    import thai_normalizer
+    from main import clean_thai_pdf_text
+
+    results = []
+    for lines in (10, 30, 100):
+        raw = ["\n".join(page) for page in generate_pages(args.micro_pages, args.seed, lines_per_page=lines)]
+        chars = sum(len(text) for text in raw)
+        # analyze_thai ทำงานกับข้อความที่ normalize แล้ว เหมือนใน correct_page_text
+        cases = (
+            ("clean_thai_pdf_text", clean_thai_pdf_text, raw),
+            ("analyze_thai", thai_normalizer.analyze_thai, [clean_thai_pdf_text(text) for text in raw]),
+        )
+        for name, func, texts in cases:
+            for text in texts[:10]:
+                func(text)
+            samples = []
+            for _ in range(args.micro_repeat):
+                for text in texts:
+                    started = time.perf_counter_ns()
+                    func(text)
+                    samples.append((time.perf_counter_ns() - started) / 1000)
+            total_seconds = sum(samples) / 1e6
+            results.append({
+                "function": name,
+                "lines_per_page": lines,
+                "pages": len(samples),
+                "chars_per_page": round(chars / len(texts)),
+                "us_mean": round(statistics.mean(samples), 1),
+                "us_p50": round(percentile(samples, 50), 1),
+                "us_p99": round(percentile(samples, 99), 1),
+                "mchars_per_sec": round(chars * args.micro_repeat / 1e6 / total_seconds, 2),
+            })
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old_runs = {(run["endpoint"], run["concurrency"]): run for run in baseline.get("runs", [])}
+    print(f"\ncompared with {baseline_path} ({baseline['meta'].get('commit')})")
+    for run in results["runs"]:
+        old = old_runs.get((run["endpoint"], run["concurrency"]))
+        if old:
+            print(
+                f"{run['endpoint']:<13} c={run['concurrency']:<3} pages/s {old['pages_per_sec']:>8.2f} -> {run['pages_per_sec']:>8.2f} "
+                f"({run['pages_per_sec'] / old['pages_per_sec']:.2f}x)  p95 {old['latency_p95']:.2f}s -> {run['latency_p95']:.2f}s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Reproducible benchmark: synthetic Thai PDFs against back2 with a stub Ollama, results as JSON'
+    )
+    parser.add_argument('--pages', type=int, default=40, help='Pages per synthetic PDF')
+    parser.add_argument('--requests', type=int, default=8, help='Requests (distinct PDFs) per concurrency level')
+    parser.add_argument('--concurrency', default='1,2,4', help='Comma separated numbers of requests in flight')
+    parser.add_argument('--endpoints', default='process-pdf,map-chapters')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--broken-ratio', type=float, default=0.05, help='Share of lines that need the LLM')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds per stub Ollama call')
+    parser.add_argument('--parallel', type=int, default=4, help='Calls the stub serves at once (its throughput)')
+    parser.add_argument('--ollama-concurrency', type=int, default=4, help='OLLAMA_CONCURRENCY for the server')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ollama-port', type=int, default=11600)
+    parser.add_argument('--micro-pages', type=int, default=200)
+    parser.add_argument('--micro-repeat', type=int, default=5)
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--out', default='bench-results.json')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": vars(args),
+        "micro": [],
+        "runs": [],
+    }
+
+    if not args.skip_micro:
+        results["micro"] = microbench(args)
+        print(f"{'function':<20} {'lines':>5} {'chars':>6} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'Mchar/s':>8}")
+        for row in results["micro"]:
+            print(
+                f"{row['function']:<20} {row['lines_per_page']:>5} {row['chars_per_page']:>6} "
+                f"{row['us_mean']:>9.1f} {row['us_p50']:>9.1f} {row['us_p99']:>9.1f} {row['mchars_per_sec']:>8.2f}"
+            )
+
+    # PDF ต่างกันทุก request (seed ต่างกัน) ไม่ให้ cache / checkpoint ช่วย, แต่ทุกระดับ concurrency ใช้ชุดเดียวกัน
+    pdfs = [
+        build_pdf(generate_pages(args.pages, args.seed * 1000 + i, broken_ratio=args.broken_ratio))
+        for i in range(args.requests)
+    ]
+    stub = serve(args.ollama_port, args.latency, parallel=args.parallel)
+    try:
+        for endpoint in args.endpoints.split(','):
+            for concurrency in [int(c) for c in args.concurrency.split(',')]:
+                run = run_level(args, endpoint, concurrency, pdfs, f"http://127.0.0.1:{args.ollama_port}")
+                results["runs"].append(run)
+                logger.info(
+                    '%s c=%d: %.2f pages/s, p50 %.2fs p95 %.2fs p99 %.2fs, %d LLM calls, peak RSS %s MB, %d errors',
+                    endpoint, concurrency, run["pages_per_sec"], run["latency_p50"], run["latency_p95"],
+                    run["latency_p99"], run["llm_calls"], run["peak_rss_mb"], run["errors"],
+                )
+    finally:
+        stub.shutdown()
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    logger.info('Wrote %s', args.out)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
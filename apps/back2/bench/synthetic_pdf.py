@@ -0,0 +1,161 @@
+import argparse
+import logging
+import random
+import sys
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('synthetic_pdf')
+
+WORDS = (
+    "เขา เธอ ผม ฉัน เรา พวกเขา เดิน วิ่ง นั่ง ยืน มอง ฟัง พูด คิด รู้สึก ยิ้ม หัวเราะ ร้องไห้ "
+    "บ้าน ถนน ตลาด โรงเรียน แม่น้ำ ภูเขา ป่า ทะเล ท้องฟ้า ฝน ลม แดด กลางคืน ตอนเช้า "
+    "สวย ใหญ่ เล็ก ช้า เร็ว เงียบ ดัง ร้อน หนาว เหนื่อย ดีใจ เสียใจ แล้ว ก็ จึง แต่ และ "
+    "ที่ ซึ่ง เพราะ ถ้า เมื่อ ไม่ ได้ ให้ ไป มา อยู่ กับ ของ ใน บน ใต้ ข้าง ระหว่าง "
+    "เรื่อง ความ รัก ชีวิต เพื่อน ครอบครัว อดีต อนาคต ความลับ คำถาม คำตอบ น้ำตา"
+).split()
+
+# สระบน/วรรณยุกต์ที่ font ไทยเก่าเก็บเป็น glyph ใน PUA (ตรงข้ามกับ thai_normalizer.PUA_MAP)
+PUA_GLYPHS = {
+    '\u0e48': '\uf70a', '\u0e49': '\uf70b', '\u0e4a': '\uf70c', '\u0e4b': '\uf70d', '\u0e4c': '\uf70e',
+    '\u0e31': '\uf710', '\u0e47': '\uf711', '\u0e34': '\uf712', '\u0e35': '\uf713', '\u0e36': '\uf714', '\u0e37': '\uf715',
+}
+THAI_DIGITS = str.maketrans("0123456789", "๐๑๒๓๔๕๖๗๘๙")
+PAGE_HEIGHT = 842
+LINE_HEIGHT = 14
+
+
+def _sentence(rng: random.Random, pua_ratio: float) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 10))]
+    line = " ".join(words)
+    if rng.random() < pua_ratio:
+        line = "".join(PUA_GLYPHS.get(ch, ch) if rng.random() < 0.5 else ch for ch in line)
+    return line
+
+
+def _broken(rng: random.Random, line: str) -> str:
+    # ความผิดที่ normalizer แก้เองไม่ได้ (วรรณยุกต์ซ้อน / สระลอยหลังช่องว่าง) -> หน้านี้ต้องส่ง LLM
+    spaces = [i for i, ch in enumerate(line) if ch == " "]
+    if spaces and rng.random() < 0.5:
+        i = rng.choice(spaces)
+        return line[:i + 1] + "ิ" + line[i + 1:]
+    return line + "่้"
+
+
+def _chapter_header(rng: random.Random, chapter: int) -> str:
+    # ส่วนใหญ่ regex จับได้ตรง ๆ, ส่วนหนึ่งสะกดเพี้ยน / ใช้เลขไทย ให้ต้องผ่าน LLM batch
+    style = rng.random()
+    if style < 0.6:
+        return f"ตอนที่ {chapter} {rng.choice(WORDS)}{rng.choice(WORDS)}"
+    if style < 0.8:
+        return f"ตอนที {str(chapter).translate(THAI_DIGITS)}"
+    return f"คอนที่ {chapter}"
+
+
+def generate_pages(page_count: int, seed: int = 0, lines_per_page: int = 30, chapter_every: int = 10,
+                   pua_ratio: float = 0.3, broken_ratio: float = 0.05) -> list:
+    """Return `page_count` pages, each a list of text lines, reproducible from `seed`.
+
+    Every page starts with a running title; every `chapter_every` pages a
+    chapter heading follows it. Body lines use PUA glyphs at `pua_ratio` and
+    carry a mark error the normalizer cannot fix at `broken_ratio`.
+    """
+    rng = random.Random(seed)
+    title = f"{rng.choice(WORDS)}{rng.choice(WORDS)}"
+    pages = []
+    chapter = 0
+    for index in range(page_count):
+        lines = [f"{title} หน้า {index + 1}"]
+        if index % chapter_every == 0:
+            chapter += 1
+            lines.append(_chapter_header(rng, chapter))
+        while len(lines) < lines_per_page:
+            line = _sentence(rng, pua_ratio)
+            if rng.random() < broken_ratio:
+                line = _broken(rng, line)
+            lines.append(line)
+        pages.append(lines)
+    return pages
+
+
+def build_pdf(pages: list) -> bytes:
+    """Write pages of text lines as a minimal PDF with a ToUnicode map, no font files needed."""
+    chars = sorted({ch for lines in pages for line in lines for ch in line})
+    if len(chars) > 255:
+        raise ValueError(f"{len(chars)} distinct characters do not fit a single-byte font")
+    codes = {ch: i + 1 for i, ch in enumerate(chars)}
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def stream(data: bytes) -> bytes:
+        return b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+
+    cmap = [
+        "/CIDInit /ProcSet findresource begin 12 dict begin begincmap /CMapName /Synthetic def",
+        "1 begincodespacerange <00> <FF> endcodespacerange",
+    ]
+    items = list(codes.items())
+    for i in range(0, len(items), 100):
+        chunk = items[i:i + 100]
+        cmap.append(f"{len(chunk)} beginbfchar")
+        cmap.extend(f"<{code:02X}> <{ord(ch):04X}>" for ch, code in chunk)
+        cmap.append("endbfchar")
+    cmap.append("endcmap CMapName currentdict /CMap defineresource pop end end")
+    cmap_id = add(stream("\n".join(cmap).encode()))
+    widths = " ".join(["500"] * 256)
+    font_id = add(
+        f"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /FirstChar 0 /LastChar 255 "
+        f"/Widths [{widths}] /ToUnicode {cmap_id} 0 R >>".encode()
+    )
+    pages_id = add(b"")
+    kids = []
+    for lines in pages:
+        ops = [f"BT /F1 12 Tf {LINE_HEIGHT} TL 40 {PAGE_HEIGHT - 42} Td"]
+        for line in lines:
+            ops.append("(" + "".join("\\%03o" % codes[ch] for ch in line) + ") Tj T*")
+        ops.append("ET")
+        content_id = add(stream("\n".join(ops).encode()))
+        kids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 {PAGE_HEIGHT}] "
+            f"/Contents {content_id} 0 R /Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        ))
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode()
+    catalog_id = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+    return bytes(out)
+
+
+def synthetic_pdf(page_count: int, seed: int = 0, **options) -> bytes:
+    return build_pdf(generate_pages(page_count, seed, **options))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic Thai novel PDF with PUA glyphs and chapter headings')
+    parser.add_argument('output')
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--lines', type=int, default=30, help='Lines per page')
+    parser.add_argument('--chapter-every', type=int, default=10)
+    parser.add_argument('--pua-ratio', type=float, default=0.3, help='Share of lines drawn with PUA glyphs')
+    parser.add_argument('--broken-ratio', type=float, default=0.05, help='Share of lines the normalizer cannot fix')
+    args = parser.parse_args()
+
+    data = synthetic_pdf(
+        args.pages, args.seed, lines_per_page=args.lines, chapter_every=args.chapter_every,
+        pua_ratio=args.pua_ratio, broken_ratio=args.broken_ratio,
+    )
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    logger.info('Wrote %d pages (%d bytes) to %s', args.pages, len(data), args.output)
@@ -0,0 +1,103 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tts_engine  # noqa: E402
+from synthetic_pdf import generate_pages  # noqa: E402
+from tts import KhanomTanTTS  # noqa: E402
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('tts_bench')
+
+
+def load_text(path: str, chars: int, seed: int) -> str:
+    if path:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+    else:
+        # บรรทัดจากนิยายสังเคราะห์ (มีชื่อเรื่อง/ชื่อตอนซ้ำทุกหน้า) ไม่ใส่ glyph PUA เพราะไม่ผ่าน normalizer
+        pages = generate_pages(max(1, chars // 500 + 1), seed, pua_ratio=0, broken_ratio=0)
+        text = '\n'.join(line for lines in pages for line in lines)
+    return text[:chars].rsplit(' ', 1)[0] if len(text) > chars else text
+
+
+def measure(name: str, run, sample_rate: int) -> dict:
+    started = time.perf_counter()
+    samples, extra = run()
+    seconds = time.perf_counter() - started
+    audio_seconds = samples / sample_rate
+    row = {
+        'mode': name,
+        'seconds': seconds,
+        'audio_seconds': audio_seconds,
+        'rtf': seconds / audio_seconds if audio_seconds else 0.0,
+        **extra,
+    }
+    logger.info('%s: %.2fs for %.1fs of audio (RTF %.3f)', name, seconds, audio_seconds, row['rtf'])
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Real-time factor of single-shot VITS inference (as sound/test.py does) '
+                    'against sentence-level batched, cached synthesis'
+    )
+    parser.add_argument('--text-file', default=None, help='UTF-8 text to read aloud, defaults to synthetic Thai')
+    parser.add_argument('--chars', type=int, default=2000, help='Characters of text to synthesize')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model-dir', default=None, help='Defaults to TTS_MODEL_DIR')
+    parser.add_argument('--speaker', default=None)
+    parser.add_argument('--processes', default='1,2', help='Process pool sizes to try for batched synthesis')
+    parser.add_argument('--skip-single-shot', action='store_true', help='Whole text in one call can run out of memory')
+    args = parser.parse_args()
+
+    text = load_text(args.text_file, args.chars, args.seed)
+    model = KhanomTanTTS(args.model_dir)
+    started = time.perf_counter()
+    model.load()
+    logger.info('Model loaded in %.1fs with %d threads', time.perf_counter() - started, model.threads)
+    units = tts_engine.split_units(text)
+    logger.info('%d characters, %d units, %d distinct', len(text), len(units), len({u for u, _ in units}))
+
+    rows = []
+    if not args.skip_single_shot:
+        rows.append(measure(
+            'single-shot', lambda: (len(model.synthesize(text, args.speaker)), {}), model.sample_rate
+        ))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for processes in (int(p) for p in args.processes.split(',')):
+            # cache ใหม่ทุกรอบ: วัดการ synthesize จริง (รอบ pool แรกรวมเวลาโหลดโมเดลใน worker)
+            cache = tts_engine.TTSCache(os.path.join(cache_dir, f'cold-{processes}.sqlite3'), max_bytes=1 << 30)
+            synthesizer = tts_engine.SpeechSynthesizer(model, cache, processes=processes)
+
+            def run():
+                pcm, counts = synthesizer.synthesize(text, args.speaker)
+                return len(pcm) // 2, counts
+
+            rows.append(measure(f'batched p={processes}', run, model.sample_rate))
+            if processes > 1:
+                # worker โหลดโมเดลแล้ว: รอบที่สองคือความเร็วของ pool ที่ warm
+                cache.close()
+                cache = tts_engine.TTSCache(os.path.join(cache_dir, f'warm-{processes}.sqlite3'), max_bytes=1 << 30)
+                synthesizer.cache = cache
+                rows.append(measure(f'batched p={processes} (warm pool)', run, model.sample_rate))
+            rows.append(measure(f'cached p={processes}', run, model.sample_rate))
+            cache.close()
+            tts_engine.shutdown_pool()
+
+    print(f"{'mode':<28} {'seconds':>8} {'audio s':>8} {'RTF':>7} {'cached':>7} {'synth':>6}")
+    for row in rows:
+        print(
+            f"{row['mode']:<28} {row['seconds']:>8.2f} {row['audio_seconds']:>8.1f} {row['rtf']:>7.3f} "
+            f"{row.get('cached', ''):>7} {row.get('synthesized', ''):>6}"
+        )
+
+
+if __name__ == '__main__':
+    main()
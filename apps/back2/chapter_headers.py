@@ -0,0 +1,41 @@
+import re
+from difflib import SequenceMatcher
+
+# รองรับกรณีเว้นวรรค เช่น "ตอน ที่ 1" หรือ "ตอนที่1"
+CHAPTER_RE = re.compile(r'ตอน\s*ที่\s*(\d+)')
+THAI_DIGITS = str.maketrans('๐๑๒๓๔๕๖๗๘๙', '0123456789')
+CHAPTER_WORD = 'ตอนที่'
+
+# ข้อความสั้น ๆ ที่อยู่หน้าตัวเลขใน header ใช้เทียบแบบ fuzzy กับคำว่า "ตอนที่"
+_NUMBER_CONTEXT_RE = re.compile(r'(\S[^\d]{0,10}?)\s*(\d+)')
+_FUZZY_RATIO = 0.6
+
+
+def parse_chapter_number(header_text: str):
+    """Return the chapter number in a header line, or None."""
+    match = CHAPTER_RE.search(header_text.translate(THAI_DIGITS))
+    return int(match.group(1)) if match else None
+
+
+def classify_header(header_text: str):
+    """Cheap first-stage decision for one page header.
+
+    Returns ("chapter", number) for an exact "ตอนที่ <n>" match (Thai digits
+    allowed), ("ambiguous", None) when something close to a chapter title is
+    present but the regex cannot read it (a misspelled "ตอนที่" before a
+    number, or the word with a spelled-out number), and ("none", None)
+    otherwise. Only ambiguous
+    headers need the LLM.
+    """
+    text = header_text.translate(THAI_DIGITS)
+    match = CHAPTER_RE.search(text)
+    if match:
+        return "chapter", int(match.group(1))
+    if 'ตอนที' in text.replace(' ', ''):
+        # มีคำว่าตอนที่แต่อ่านเลขไม่ได้ เช่น เขียนเป็นตัวหนังสือ "ตอนที่สิบสอง"
+        return "ambiguous", None
+    for context, _ in _NUMBER_CONTEXT_RE.findall(text):
+        word = context.replace(' ', '')[-len(CHAPTER_WORD) - 2:]
+        if SequenceMatcher(None, word, CHAPTER_WORD).ratio() >= _FUZZY_RATIO:
+            return "ambiguous", None
+    return "none", None
@@ -0,0 +1,93 @@
+import re
+import unicodedata
+
+# ประมาณจำนวน token แบบไม่ต้องโหลด tokenizer: ภาษาไทยราว 2 ตัวอักษรต่อ token, อักษรอื่นราว 4
+THAI_CHARS_PER_TOKEN = 2.0
+OTHER_CHARS_PER_TOKEN = 4.0
+_DROP_THAI = {c: None for c in range(0x0e00, 0x0e80)}
+
+# ตัดที่ย่อหน้าก่อน แล้วค่อยบรรทัด แล้วค่อยช่องว่าง (ภาษาไทยเว้นวรรคระหว่างประโยค)
+SEPARATORS = ("\n\n", "\n", " ")
+
+PAGE_MARKER = "<<<{}>>>"
+_MARKER_RE = re.compile(r"^[ \t]*<<<(\d+)>>>[ \t]*$", re.MULTILINE)
+
+
+def estimate_tokens(text: str) -> int:
+    thai = len(text) - len(text.translate(_DROP_THAI))
+    return int(thai / THAI_CHARS_PER_TOKEN + (len(text) - thai) / OTHER_CHARS_PER_TOKEN) + 1
+
+
+def split_text(text: str, max_tokens: int, separators=SEPARATORS) -> list:
+    """Split `text` into pieces of at most about `max_tokens` tokens.
+
+    Pieces keep their trailing separator, so `"".join(pieces) == text`.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    if not separators:
+        return _hard_split(text, max_tokens)
+    sep, rest = separators[0], separators[1:]
+    parts = text.split(sep)
+    units = [part + sep for part in parts[:-1]] + [parts[-1]]
+    pieces = []
+    current, current_tokens = "", 0
+    for unit in units:
+        tokens = estimate_tokens(unit)
+        if tokens > max_tokens:
+            if current:
+                pieces.append(current)
+                current, current_tokens = "", 0
+            pieces.extend(split_text(unit, max_tokens, rest))
+        elif current and current_tokens + tokens > max_tokens:
+            pieces.append(current)
+            current, current_tokens = unit, tokens
+        else:
+            current += unit
+            current_tokens += tokens
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _hard_split(text: str, max_tokens: int) -> list:
+    # ไม่มีช่องว่างให้ตัด: ตัดตามจำนวนตัวอักษร แต่ไม่แยกสระ/วรรณยุกต์ออกจากพยัญชนะ
+    size = max(1, int(max_tokens * THAI_CHARS_PER_TOKEN))
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        while end < len(text) and unicodedata.combining(text[end]):
+            end += 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+def correct_pieces(pieces: list, corrected: list) -> str:
+    """Put corrected piece texts back together with the original whitespace."""
+    out = []
+    for piece, fixed in zip(pieces, corrected):
+        core = piece.strip()
+        if not core:
+            out.append(piece)
+            continue
+        start = piece.index(core)
+        out.append(piece[:start] + fixed + piece[start + len(core):])
+    return "".join(out)
+
+
+def pack_pages(texts: list) -> str:
+    return "\n".join(f"{PAGE_MARKER.format(i)}\n{text}" for i, text in enumerate(texts, start=1))
+
+
+def unpack_pages(output: str, count: int):
+    """Split a packed answer back into `count` texts, or None if markers got lost."""
+    matches = list(_MARKER_RE.finditer(output))
+    if [int(m.group(1)) for m in matches] != list(range(1, count + 1)):
+        return None
+    texts = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(output)
+        texts.append(output[match.end():end].strip())
+    return texts
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+
+class Spool:
+    """Temp file an upload is copied into chunk by chunk, hashed on the way."""
+
+    def __init__(self, directory: str):
+        self.file = tempfile.NamedTemporaryFile(suffix=".pdf", dir=directory, delete=False)
+        self.path = self.file.name
+        self.size = 0
+        self._digest = hashlib.sha256()
+
+    def write(self, chunk: bytes):
+        self._digest.update(chunk)
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def finish(self) -> str:
+        """Close the file and return the document id of its content."""
+        self.file.close()
+        return self._digest.hexdigest()
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def sample_page_nums(total_pages: int, count: int) -> list:
+    """Up to `count` page numbers spread evenly over the document."""
+    if total_pages <= count:
+        return list(range(1, total_pages + 1))
+    step = total_pages / count
+    return sorted({int(i * step) + 1 for i in range(count)})
+
+
+def _pack(text):
+    return None if text is None else zlib.compress(text.encode("utf-8"))
+
+
+def _unpack(blob):
+    return None if blob is None else zlib.decompress(blob).decode("utf-8")
+
+
+class DocumentStore:
+    """Uploaded PDFs plus their pre-extracted, cleaned per-page text.
+
+    A document is identified by the SHA-256 of its bytes, so uploading the
+    same file twice is a no-op. Page text and header-crop text are stored
+    zlib-compressed in one SQLite file next to the original PDFs.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "documents.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL,"
+            " total_pages INTEGER NOT NULL, created_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " doc_id TEXT NOT NULL, page_num INTEGER NOT NULL, text BLOB, header BLOB,"
+            " PRIMARY KEY (doc_id, page_num));"
+            "CREATE TABLE IF NOT EXISTS page_results ("
+            " doc_id TEXT NOT NULL, page_num INTEGER NOT NULL, variant TEXT NOT NULL, text BLOB,"
+            " created_at REAL NOT NULL, PRIMARY KEY (doc_id, variant, page_num));"
+            # chapter index: ทุกหน้าที่ scan แล้ว (fingerprint ของ header + เลขตอนถ้าเป็นหน้าแรกของตอน)
+            "CREATE TABLE IF NOT EXISTS chapter_pages ("
+            " doc_id TEXT NOT NULL, variant TEXT NOT NULL, page_num INTEGER NOT NULL,"
+            " fingerprint TEXT NOT NULL, chapter INTEGER, PRIMARY KEY (doc_id, variant, page_num));"
+            "CREATE TABLE IF NOT EXISTS chapter_scans ("
+            " doc_id TEXT NOT NULL, variant TEXT NOT NULL, scanned_pages INTEGER NOT NULL,"
+            " first_fingerprint TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (doc_id, variant));"
+            # key ของ running header/footer ที่หาจากหน้าตัวอย่าง (running_lines.py) ต่อเอกสาร
+            "CREATE TABLE IF NOT EXISTS running_lines ("
+            " doc_id TEXT NOT NULL, variant TEXT NOT NULL, keys TEXT NOT NULL,"
+            " created_at REAL NOT NULL, PRIMARY KEY (doc_id, variant));"
+        )
+        self._db.commit()
+
+    def pdf_path(self, doc_id: str) -> str:
+        return os.path.join(self.root, f"{doc_id}.pdf")
+
+    def info(self, doc_id: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, filename, size, total_pages, created_at FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("document_id", "filename", "size", "total_pages", "created_at"), row))
+
+    def has_pdf(self, doc_id: str) -> bool:
+        return os.path.exists(self.pdf_path(doc_id))
+
+    def spool(self) -> Spool:
+        # temp file อยู่ใต้ root เดียวกัน ย้ายเข้าที่ด้วย os.replace ได้โดยไม่ต้อง copy
+        directory = os.path.join(self.root, "uploads")
+        os.makedirs(directory, exist_ok=True)
+        return Spool(directory)
+
+    def save_pdf_file(self, doc_id: str, spool: Spool):
+        os.replace(spool.path, self.pdf_path(doc_id))
+
+    def save_pages(self, doc_id: str, filename: str, total_pages: int, pages):
+        """Store extracted pages; `pages` yields (page_num, text, header) tuples."""
+        size = os.path.getsize(self.pdf_path(doc_id))
+        rows = [(doc_id, page_num, _pack(text), _pack(header)) for page_num, text, header in pages]
+        with self._lock:
+            # แถว documents ใส่ทีหลังสุดใน transaction เดียวกัน = เอกสารพร้อมใช้งาน
+            self._db.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            self._db.executemany("INSERT INTO pages (doc_id, page_num, text, header) VALUES (?, ?, ?, ?)", rows)
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (id, filename, size, total_pages, created_at) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, filename, size, total_pages, time.time()),
+            )
+            self._db.commit()
+
+    def open(self, doc_id: str):
+        info = self.info(doc_id)
+        return StoredDocument(self, info) if info else None
+
+    def _iter_column(self, column: str, doc_id: str, start: int, end: int):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT page_num, {column} FROM pages WHERE doc_id = ? AND page_num BETWEEN ? AND ? ORDER BY page_num",
+                (doc_id, start, end),
+            ).fetchall()
+        for page_num, blob in rows:
+            yield page_num, _unpack(blob)
+
+    def load_page_texts(self, doc_id: str, page_nums: list) -> list:
+        marks = ",".join("?" * len(page_nums))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT text FROM pages WHERE doc_id = ? AND page_num IN ({marks}) ORDER BY page_num",
+                (doc_id, *page_nums),
+            ).fetchall()
+        return [_unpack(blob) for blob, in rows]
+
+    def load_results(self, doc_id: str, variant: str, start: int, end: int) -> dict:
+        """Checkpointed corrections for pages start..end: {page_num: text or None}."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page_num, text FROM page_results"
+                " WHERE doc_id = ? AND variant = ? AND page_num BETWEEN ? AND ?",
+                (doc_id, variant, start, end),
+            ).fetchall()
+        return {page_num: _unpack(blob) for page_num, blob in rows}
+
+    def save_result(self, doc_id: str, variant: str, page_num: int, text):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO page_results (doc_id, page_num, variant, text, created_at) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, page_num, variant, _pack(text), time.time()),
+            )
+            self._db.commit()
+
+    def load_running_lines(self, doc_id: str, variant: str):
+        """Stored running-line keys of a document, or None if not detected yet."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT keys FROM running_lines WHERE doc_id = ? AND variant = ?", (doc_id, variant)
+            ).fetchone()
+        return frozenset(json.loads(row[0])) if row else None
+
+    def save_running_lines(self, doc_id: str, variant: str, keys: frozenset):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO running_lines (doc_id, variant, keys, created_at) VALUES (?, ?, ?, ?)",
+                (doc_id, variant, json.dumps(sorted(keys), ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+    def scanned_pages(self, doc_id: str, variant: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT scanned_pages FROM chapter_scans WHERE doc_id = ? AND variant = ?", (doc_id, variant)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def chapter_starts(self, doc_id: str, variant: str) -> list:
+        """[(page_num, chapter)] for every indexed page that starts a chapter."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT page_num, chapter FROM chapter_pages"
+                " WHERE doc_id = ? AND variant = ? AND chapter IS NOT NULL ORDER BY page_num",
+                (doc_id, variant),
+            ).fetchall()
+
+    def page_fingerprint(self, doc_id: str, variant: str, page_num: int):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint FROM chapter_pages WHERE doc_id = ? AND variant = ? AND page_num = ?",
+                (doc_id, variant, page_num),
+            ).fetchone()
+        return row[0] if row else None
+
+    def prefix_candidates(self, variant: str, first_fingerprint: str, total_pages: int) -> list:
+        """Indexed documents starting with the same page and shorter than `total_pages`, longest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT doc_id, scanned_pages FROM chapter_scans"
+                " WHERE variant = ? AND first_fingerprint = ? AND scanned_pages < ? ORDER BY scanned_pages DESC",
+                (variant, first_fingerprint, total_pages),
+            ).fetchall()
+
+    def copy_chapter_pages(self, from_doc: str, to_doc: str, variant: str, upto: int):
+        # PDF ที่มีตอนใหม่ต่อท้าย: ใช้ index ของไฟล์เดิมสำหรับหน้าที่เหมือนกัน
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO chapter_pages (doc_id, variant, page_num, fingerprint, chapter)"
+                " SELECT ?, variant, page_num, fingerprint, chapter FROM chapter_pages"
+                " WHERE doc_id = ? AND variant = ? AND page_num <= ?",
+                (to_doc, from_doc, variant, upto),
+            )
+            self._db.commit()
+
+    def save_chapter_pages(self, doc_id: str, variant: str, rows: list):
+        """Add scanned pages, `rows` of (page_num, fingerprint, chapter), and mark them indexed."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chapter_pages (doc_id, variant, page_num, fingerprint, chapter) VALUES (?, ?, ?, ?, ?)",
+                [(doc_id, variant, *row) for row in rows],
+            )
+            scanned, first = self._db.execute(
+                "SELECT MAX(page_num), (SELECT fingerprint FROM chapter_pages WHERE doc_id = ? AND variant = ? AND page_num = 1)"
+                " FROM chapter_pages WHERE doc_id = ? AND variant = ?",
+                (doc_id, variant, doc_id, variant),
+            ).fetchone()
+            if scanned is not None and first is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO chapter_scans (doc_id, variant, scanned_pages, first_fingerprint, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, variant, scanned, first, time.time()),
+                )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class StoredDocument:
+    """Page source backed by the document store (same interface as PdfSource)."""
+
+    def __init__(self, store: DocumentStore, info: dict):
+        self.store = store
+        self.document_id = info["document_id"]
+        self.filename = info["filename"]
+        self.total_pages = info["total_pages"]
+
+    def iter_pages(self, start: int, end: int, skip=frozenset()):
+        for page_num, text in self.store._iter_column("text", self.document_id, start, end):
+            if page_num not in skip:
+                yield page_num, text
+
+    def iter_headers(self, start: int = 1, end: int = None):
+        return self.store._iter_column("header", self.document_id, start, end or self.total_pages)
+
+    def sample_pages(self, count: int) -> list:
+        return self.store.load_page_texts(self.document_id, sample_page_nums(self.total_pages, count))
+
+    def close(self):
+        pass
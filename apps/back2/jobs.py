@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobStore:
+    """SQLite-backed job queue with per-page results and per-chapter audio files.
+
+    Jobs survive a restart: anything still marked running when the store is
+    opened is put back in the queue.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL,"
+            " progress_done INTEGER NOT NULL DEFAULT 0, progress_total INTEGER,"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL);"
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at);"
+            "CREATE TABLE IF NOT EXISTS job_pages ("
+            " job_id TEXT NOT NULL, page_num INTEGER NOT NULL, text TEXT,"
+            " PRIMARY KEY (job_id, page_num));"
+            "CREATE TABLE IF NOT EXISTS job_chapters ("
+            " job_id TEXT NOT NULL, chapter INTEGER NOT NULL, start_page INTEGER NOT NULL, end_page INTEGER NOT NULL,"
+            " path TEXT NOT NULL, audio_seconds REAL NOT NULL, bytes INTEGER NOT NULL, finished_at REAL NOT NULL,"
+            " PRIMARY KEY (job_id, chapter));"
+        )
+        self._db.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, progress_done = 0 WHERE status = 'running'"
+        )
+        self._db.commit()
+
+    def submit(self, kind: str, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time()),
+            )
+            self._db.commit()
+        return job_id
+
+    def claim_next(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row[0])
+            )
+            self._db.commit()
+        return row[0], row[1], json.loads(row[2])
+
+    def set_total(self, job_id: str, total: int):
+        # เรียกตอนเริ่มรันทุกครั้ง: งานที่ resume นับความคืบหน้าใหม่ตั้งแต่หน้าแรก (หน้าที่มี checkpoint ถูกเล่นซ้ำ)
+        self._execute("UPDATE jobs SET progress_total = ?, progress_done = 0 WHERE id = ?", (total, job_id))
+
+    def advance(self, job_id: str, count: int = 1):
+        self._execute("UPDATE jobs SET progress_done = progress_done + ? WHERE id = ?", (count, job_id))
+
+    def record_page(self, job_id: str, page_num: int, text):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO job_pages (job_id, page_num, text) VALUES (?, ?, ?)",
+                (job_id, page_num, text),
+            )
+            self._db.execute("UPDATE jobs SET progress_done = progress_done + 1 WHERE id = ?", (job_id,))
+            self._db.commit()
+
+    def record_chapter(self, job_id: str, chapter: dict):
+        self._execute(
+            "INSERT OR REPLACE INTO job_chapters"
+            " (job_id, chapter, start_page, end_page, path, audio_seconds, bytes, finished_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, chapter["chapter"], chapter["start_page"], chapter["end_page"], chapter["path"],
+             chapter["audio_seconds"], chapter["bytes"], time.time()),
+        )
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+
+    def cancel_if_queued(self, job_id: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, params, status, progress_done, progress_total, result, error,"
+                " created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(
+            ("job_id", "kind", "params", "status", "progress_done", "progress_total", "result", "error",
+             "created_at", "started_at", "finished_at"),
+            row,
+        ))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def pages(self, job_id: str):
+        with self._lock:
+            return self._db.execute(
+                "SELECT page_num, text FROM job_pages WHERE job_id = ? ORDER BY page_num", (job_id,)
+            ).fetchall()
+
+    def chapters(self, job_id: str) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chapter, start_page, end_page, path, audio_seconds, bytes FROM job_chapters"
+                " WHERE job_id = ? ORDER BY chapter",
+                (job_id,),
+            ).fetchall()
+        return [dict(zip(("chapter", "start_page", "end_page", "path", "audio_seconds", "bytes"), row)) for row in rows]
+
+    def _execute(self, sql: str, args: tuple):
+        with self._lock:
+            self._db.execute(sql, args)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobRunner:
+    """Fixed pool of asyncio workers pulling jobs from a JobStore.
+
+    `handlers` maps a job kind to `async def handler(job_id, params)`; its
+    return value is stored as the job result.
+    """
+
+    def __init__(self, store: JobStore, handlers: dict, workers: int):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self._wakeup = None
+        self._worker_tasks = []
+        self._running = {}
+        self._cancel_requested = set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def cancel(self, job_id: str) -> bool:
+        if await run_in_threadpool(self.store.cancel_if_queued, job_id):
+            return True
+        task = self._running.get(job_id)
+        if task is None:
+            return False
+        self._cancel_requested.add(job_id)
+        task.cancel()
+        return True
+
+    async def _worker(self, worker_num: int):
+        while True:
+            claimed = await run_in_threadpool(self.store.claim_next)
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id, kind, params = claimed
+            print(f"[job {job_id}] worker {worker_num} started {kind}", flush=True)
+            task = asyncio.create_task(self.handlers[kind](job_id, params))
+            self._running[job_id] = task
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if job_id not in self._cancel_requested:
+                    # server กำลังปิด: ปล่อยสถานะ running ไว้ จะถูก requeue ตอนเปิดใหม่
+                    raise
+                self._cancel_requested.discard(job_id)
+                await run_in_threadpool(self.store.finish, job_id, "cancelled")
+                print(f"[job {job_id}] cancelled", flush=True)
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                await run_in_threadpool(self.store.finish, job_id, "failed", None, detail)
+                print(f"[job {job_id}] failed: {detail}", flush=True)
+            else:
+                await run_in_threadpool(self.store.finish, job_id, "done", result)
+                print(f"[job {job_id}] done", flush=True)
+            finally:
+                self._running.pop(job_id, None)
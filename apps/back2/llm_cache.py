@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+
+class LLMCache:
+    """Content-addressed on-disk cache for Ollama results.
+
+    Entries are keyed by a hash of (kind, model, prompt version, input text)
+    and stored in SQLite. When the stored values grow past `max_bytes` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def make_key(kind: str, model: str, prompt_version: str, text: str) -> str:
+        digest = hashlib.sha256()
+        for part in (kind, model, prompt_version, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, kind: str, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[kind] += 1
+                return None
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits[kind] += 1
+            return row[0]
+
+    @staticmethod
+    def _size(value) -> int:
+        return len(value.encode("utf-8"))
+
+    def put(self, kind: str, key: str, value: str):
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, value, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # ลบ entry ที่ไม่ได้ใช้นานที่สุดจนขนาดรวมต่ำกว่า max_bytes
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM entries ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    return
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            kinds = sorted(set(self.hits) | set(self.misses))
+            return {
+                "path": self.path,
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                "by_kind": {k: {"hits": self.hits[k], "misses": self.misses[k]} for k in kinds},
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
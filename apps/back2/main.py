@@ -1,11 +1,28 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
-import pdfplumber
-import requests
+from fastapi.responses import StreamingResponse, Response, FileResponse
+from starlette.concurrency import run_in_threadpool
 import json
-import io
+import asyncio
+import hashlib
 import time
-import re
+import os
+from contextlib import aclosing
+from pipeline import pipeline_pages, MicroBatcher
+from llm_cache import LLMCache
+from document_store import DocumentStore, sample_page_nums
+from jobs import JobStore, JobRunner
+from ollama_client import OLLAMA_NUM_CTX, OllamaClient, OllamaError, CircuitOpenError, scheduler
+import thai_normalizer
+from pdf_extract import PdfExtractor, MemoryLimitError, check_memory, shutdown_pool
+import chapter_headers
+import running_lines
+import prompts
+from chunking import estimate_tokens, split_text, correct_pieces, pack_pages, unpack_pages
+import metrics
+from tts import KhanomTanTTS, TTSUnavailableError, TTS_MAX_CHARS, wav_bytes
+import tts_engine
+import audio_encode
 
 app= FastAPI()
 
@@ -17,223 +34,787 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+@app.middleware("http")
+async def identify_ollama_client(request, call_next):
+    # แบ่ง slot ของ Ollama อย่างยุติธรรมระหว่างผู้ใช้: ระบุตัวด้วย header X-Client-Id หรือ IP
+    scheduler.use_client(request.headers.get("x-client-id") or (request.client.host if request.client else ""))
+    return await call_next(request)
+
 OLLAMA_MODEL = "scb10x/typhoon2.1-gemma3-4b:latest"
 
-def process_text_with_ollama(text_input: str) -> str:
-    prompt = (
-        f"Correct the Thai vowel and tone mark encoding errors in the text below. Rules:\n"
-        f"1. Fix all 'sara-loi' (floating vowels) and misplaced tone marks to standard Thai grammar.\n"
-        f"2. Maintain the original meaning and writing style.\n"
-        f"3. CRITICAL: Output ONLY the corrected text. Do not include any introduction, preamble, notes, or conclusion."
-        f"--- my text ---\n"
-        f"{text_input}\n"
-        f"Output ONLY the result."
-    )
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False 
-    }
+# เปลี่ยนเลข version ทุกครั้งที่แก้ prompt เพื่อไม่ให้ใช้ผลลัพธ์เก่าใน cache
+CORRECTION_PROMPT_VERSION = "1"
+HEADER_PROMPT_VERSION = "1"
+# "chat" ส่งคำสั่งเป็น system message ที่เหมือนเดิมทุกครั้งผ่าน /api/chat ให้ Ollama reuse prefix ได้,
+# "generate" ส่งคำสั่งรวมกับข้อความทุกหน้าผ่าน /api/generate แบบเดิม
+LLM_PROMPT_MODE = os.environ.get("LLM_PROMPT_MODE", "chat")
+CORRECTION_VARIANT = CORRECTION_PROMPT_VERSION if LLM_PROMPT_MODE == "generate" else f"{CORRECTION_PROMPT_VERSION}-{LLM_PROMPT_MODE}"
+HEADER_BATCH_PROMPT_VERSION = "1"
+# chapter index ที่เก็บไว้ใช้ได้เฉพาะเมื่อหาตอนด้วยโมเดล / prompt / normalizer ชุดเดียวกัน
+CHAPTER_INDEX_VARIANT = f"{OLLAMA_MODEL}:{HEADER_PROMPT_VERSION}:{HEADER_BATCH_PROMPT_VERSION}:{thai_normalizer.VERSION}"
+# จำนวน header ที่ไม่ชัดเจนที่รวมส่ง LLM ใน prompt เดียว
+HEADER_BATCH_SIZE = int(os.environ.get("HEADER_BATCH_SIZE", "20"))
+# งบ token ต่อการเรียก LLM: ข้อความยาวกว่า LLM_CHUNK_TOKENS ตัดเป็นช่วงที่ช่องว่าง/บรรทัด
+# ส่วนหน้าที่สั้นกว่า LLM_PACK_BELOW_TOKENS รวมหลายหน้า (ไม่เกิน LLM_PACK_MAX_PAGES) ในการเรียกครั้งเดียว
+# context ตั้งที่เดียวใน preset ของ client (OLLAMA_NUM_CTX หรือ LLM_NUM_CTX) ให้ทุกงานของโมเดลเดียวกันใช้ค่าเดียวกัน
+LLM_NUM_CTX = OLLAMA_NUM_CTX
+LLM_CHUNK_TOKENS = int(os.environ.get("LLM_CHUNK_TOKENS", "1500"))
+LLM_PACK_BELOW_TOKENS = int(os.environ.get("LLM_PACK_BELOW_TOKENS", "300"))
+LLM_PACK_MAX_PAGES = int(os.environ.get("LLM_PACK_MAX_PAGES", "8"))
+# ข้าม LLM สำหรับหน้าที่ normalizer ตรวจแล้วว่าถูกต้อง (ตั้งเป็น 0 เพื่อส่งทุกหน้าให้ LLM เหมือนเดิม)
+LLM_SKIP_VALID_PAGES = os.environ.get("LLM_SKIP_VALID_PAGES", "1") == "1"
+# ตัดชื่อเรื่อง / ชื่อผู้แต่ง / เลขหน้าที่ซ้ำทุกหน้าออกก่อนส่ง LLM (หาจากหน้าตัวอย่าง RUNNING_LINES_SAMPLE_PAGES หน้า)
+# RESTORE_RUNNING_LINES=1 ใส่บรรทัดเหล่านั้นกลับในผลลัพธ์ตามตำแหน่งเดิม (บน/ล่าง), 0 = ตัดทิ้งไปเลย
+STRIP_RUNNING_LINES = os.environ.get("STRIP_RUNNING_LINES", "1") == "1"
+RESTORE_RUNNING_LINES = os.environ.get("RESTORE_RUNNING_LINES", "1") == "1"
+RUNNING_LINES_SAMPLE_PAGES = int(os.environ.get("RUNNING_LINES_SAMPLE_PAGES", "30"))
+# running line ที่หาแล้วเก็บต่อเอกสาร ใช้ซ้ำได้เมื่อเกณฑ์การหาเหมือนเดิม
+RUNNING_LINES_VARIANT = (
+    f"{RUNNING_LINES_SAMPLE_PAGES}:{running_lines.EDGE_LINES}:{running_lines.MIN_RATIO}:{running_lines.MIN_PAGES}"
+)
+llm_cache = LLMCache(
+    os.environ.get("LLM_CACHE_PATH", "cache/llm_cache.sqlite3"),
+    max_bytes=int(os.environ.get("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
+document_store = DocumentStore(os.environ.get("DOCUMENT_STORE_DIR", "documents"))
+# จำนวนงาน background ที่รันพร้อมกัน (แต่ละงานยังส่ง Ollama พร้อมกันได้ตาม concurrency ของงาน)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+job_store = JobStore(os.environ.get("JOB_STORE_PATH", "jobs/jobs.sqlite3"))
+
+# connection pool + load balancing + retry + circuit breaker + keep_alive ใช้ร่วมกันทุก request
+# (Ollama หลายเครื่องตั้งผ่าน OLLAMA_HOSTS ดู packages/ollama-client)
+ollama = OllamaClient()
+# เวลาที่รอ slot ใน scheduler (แยกจาก queue_wait ของ concurrency ต่อ request)
+ollama.scheduler.on_wait = lambda priority, seconds: metrics.record(f"ollama_wait:{priority}", seconds)
+# จำนวน request ที่ส่งไป Ollama แต่ละเครื่องพร้อมกันได้ (ตั้งให้เท่ากับ OLLAMA_NUM_PARALLEL ของเครื่อง Ollama)
+OLLAMA_CONCURRENCY_PER_INSTANCE = int(os.environ.get("OLLAMA_CONCURRENCY", "4"))
+OLLAMA_CONCURRENCY = OLLAMA_CONCURRENCY_PER_INSTANCE * len(ollama.nodes)
+_health_task = None
+
+@app.on_event("startup")
+async def start_ollama_health_checks():
+    global _health_task
+    _health_task = asyncio.create_task(ollama.run_health_checks())
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    await job_runner.stop()
+    if _health_task is not None:
+        _health_task.cancel()
+    await ollama.aclose()
+    llm_cache.close()
+    document_store.close()
+    job_store.close()
+    shutdown_pool()
+
+def correction_options(text_input: str) -> dict:
+    # คำตอบยาวพอ ๆ กับข้อความที่ส่งไป เผื่อไว้ 30% แทนที่จะปล่อยให้ generate จนเต็ม context
+    num_predict = min(int(estimate_tokens(text_input) * 1.3) + 64, LLM_NUM_CTX)
+    return {"num_predict": num_predict}
+
+async def ask_correction(text: str, parts: int = 0) -> str:
+    """One correction call; `parts` > 0 means `text` is `parts` packed pages."""
+    kind = "packed" if parts else "page"
+    call_start = time.perf_counter()
     try:
-        response = requests.post(
-            OLLAMA_API_URL, 
-            headers={"Content-Type": "application/json"}, 
-            data=json.dumps(payload),
-            timeout=1200
+        if LLM_PROMPT_MODE == "chat":
+            result = await ollama.achat(
+                prompts.correction_messages(text), OLLAMA_MODEL, preset="correction",
+                options=correction_options(text), timeout=1200, priority=scheduler.BULK
+            )
+            metrics.record_llm(kind, result, time.perf_counter() - call_start)
+            return result['message']['content']
+        prompt = prompts.packed_correction_prompt(text, parts) if parts else prompts.correction_prompt(text)
+        result = await ollama.agenerate(
+            prompt, OLLAMA_MODEL, preset="correction", options=correction_options(text), timeout=1200,
+            priority=scheduler.BULK
         )
-        response.raise_for_status() 
-        result = response.json()
-        return result['response'].strip()
-    except requests.exceptions.RequestException as e:
+        metrics.record_llm(kind, result, time.perf_counter() - call_start)
+        return result['response']
+    except OllamaError as e:
+        metrics.record_llm_error(kind, time.perf_counter() - call_start)
         print(f"Error calling Ollama API: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to communicate with Ollama or Ollama failed to process: {e}. "f"Please check if Ollama is running and model '{OLLAMA_MODEL}' is installed.")
+        status_code = 503 if isinstance(e, CircuitOpenError) else 500
+        raise HTTPException(status_code=status_code, detail=f"Failed to communicate with Ollama or Ollama failed to process: {e}. "f"Please check if Ollama is running and model '{OLLAMA_MODEL}' is installed.")
+
+async def process_text_with_ollama(text_input: str) -> str:
+    cache_key = llm_cache.make_key("page", OLLAMA_MODEL, CORRECTION_VARIANT, text_input)
+    cached = await run_in_threadpool(llm_cache.get, "page", cache_key)
+    if cached is not None:
+        return cached
+    corrected = (await ask_correction(text_input)).strip()
+    await run_in_threadpool(llm_cache.put, "page", cache_key, corrected)
+    return corrected
+
+async def process_packed_with_ollama(texts: list) -> list:
+    """Correct several short pages in one call; raises ValueError if the markers come back wrong."""
+    corrected = unpack_pages(await ask_correction(pack_pages(texts), len(texts)), len(texts))
+    if corrected is None:
+        raise ValueError("page markers missing or out of order in the answer")
+    for text, fixed in zip(texts, corrected):
+        cache_key = llm_cache.make_key("page", OLLAMA_MODEL, CORRECTION_VARIANT, text)
+        await run_in_threadpool(llm_cache.put, "page", cache_key, fixed)
+    return corrected
 
 def clean_thai_pdf_text(text: str) -> str:
     if not text:
         return ""
-    replace_dict = {
-        '\uf700': 'ฐ', '\uf701': 'ญ', '\uf702': 'ฐ', '\uf703': 'ญ',
-        '\uf704': 'ญ', '\uf705': 'ฐ', '\uf706': 'ญ', '\uf707': 'ฐ',
-        '\uf708': 'ญ', '\uf709': 'ญ', '\uf70a': '่', '\uf70b': '้',
-        '\uf70c': '๊', '\uf70d': '๋', '\uf70e': '์', '\uf70f': 'ํ',
-        '\uf710': 'ั', '\uf711': '็', '\uf712': 'ิ', '\uf713': 'ี',
-        '\uf714': 'ึ', '\uf715': 'ื', '\uf716': 'ุ', '\uf717': 'ู',
-        '\uf718': 'ุ', '\uf719': 'ู', '\uf71a': '็',
-    }
-    cleaned_text = text
-    for pua_char, std_char in replace_dict.items():
-        cleaned_text = cleaned_text.replace(pua_char, std_char)
+    # map PUA ด้วย translate table + จัดลำดับสระ/วรรณยุกต์ในรอบเดียว (ดู thai_normalizer.py)
+    with metrics.timed("clean"):
+        cleaned_text, _ = thai_normalizer.normalize_thai(text)
     return cleaned_text
 
+async def correct_page_text(text_input: str, llm=process_text_with_ollama) -> str:
+    # หน้าที่ normalizer แก้จนถูกต้องหมดแล้วไม่ต้องส่ง LLM, หน้าที่ยังมีจุดน่าสงสัยส่งเฉพาะบรรทัดนั้น
+    if not LLM_SKIP_VALID_PAGES:
+        return await llm(text_input)
+    report = thai_normalizer.analyze_thai(text_input)
+    if report.valid:
+        return text_input
+    lines = text_input.split("\n")
+    if len(report.suspicious_lines) * 2 > len(lines):
+        return await llm(text_input)
+    suspicious_text = "\n".join(lines[i] for i in report.suspicious_lines)
+    corrected_lines = (await llm(suspicious_text)).split("\n")
+    if len(corrected_lines) != len(report.suspicious_lines):
+        # LLM รวม/แยกบรรทัดเอง ประกบกลับไม่ได้ -> ส่งทั้งหน้า
+        return await llm(text_input)
+    for line_num, corrected in zip(report.suspicious_lines, corrected_lines):
+        lines[line_num] = corrected
+    return "\n".join(lines)
+
+def make_page_corrector(workers: int, running=frozenset()):
+    # เรียก LLM พร้อมกันไม่เกิน workers ครั้ง; หน้าสั้นรอรวมกันใน batcher, ข้อความยาวตัดเป็นช่วง
+    # running: key ของ running header/footer (running_lines.py) ที่ตัดออกก่อนส่ง LLM
+    llm_slots = asyncio.Semaphore(workers)
+
+    async def acquire_slot():
+        with metrics.timed("queue_wait"):
+            await llm_slots.acquire()
+
+    async def call(text):
+        await acquire_slot()
+        try:
+            return await process_text_with_ollama(text)
+        finally:
+            llm_slots.release()
+
+    async def run_pack(texts):
+        if len(texts) == 1:
+            return [await call(texts[0])]
+        try:
+            await acquire_slot()
+            try:
+                return await process_packed_with_ollama(texts)
+            finally:
+                llm_slots.release()
+        except ValueError as e:
+            print(f"Packed correction of {len(texts)} pages failed ({e}), sending them one by one", flush=True)
+            return list(await asyncio.gather(*(call(text) for text in texts)))
+
+    batcher = MicroBatcher(run_pack, max_batch=LLM_PACK_MAX_PAGES, size=estimate_tokens, max_size=LLM_CHUNK_TOKENS)
+
+    async def fix(text):
+        return await call(text) if text else text
+
+    async def llm(text):
+        tokens = estimate_tokens(text)
+        if tokens > LLM_CHUNK_TOKENS:
+            pieces = split_text(text, LLM_CHUNK_TOKENS)
+            fixed = await asyncio.gather(*(fix(piece.strip()) for piece in pieces))
+            return correct_pieces(pieces, fixed)
+        if tokens < LLM_PACK_BELOW_TOKENS:
+            cache_key = llm_cache.make_key("page", OLLAMA_MODEL, CORRECTION_VARIANT, text)
+            cached = await run_in_threadpool(llm_cache.get, "page", cache_key)
+            if cached is not None:
+                return cached
+            return await batcher.submit(text)
+        return await call(text)
+
+    async def correct(text_input):
+        body, removed = running_lines.strip_running_lines(text_input, running)
+        corrected = await correct_page_text(body, llm) if body.strip() else body
+        if not RESTORE_RUNNING_LINES:
+            return corrected
+        return running_lines.restore_running_lines(corrected, removed)
+
+    return correct
+
+# อ่านไฟล์ที่อัปโหลดทีละก้อนลง temp file แทนการโหลดทั้งไฟล์เข้า memory
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+async def spool_upload(file: UploadFile):
+    """Copy an upload to a temp file; returns (spool, document_id)."""
+    spool = document_store.spool()
+    try:
+        with metrics.timed("upload"):
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                await run_in_threadpool(spool.write, chunk)
+        return spool, spool.finish()
+    except BaseException:
+        spool.discard()
+        raise
+
+def _open_pdf(path: str):
+    # backend / จำนวน process / เพดาน memory ตั้งผ่าน PDF_BACKEND, PDF_PROCESSES, PDF_MEMORY_LIMIT_MB (ดู pdf_extract.py)
+    # เกินเพดานอยู่แล้วไม่รับงานใหม่
+    check_memory()
+    with metrics.timed("open"):
+        return PdfExtractor(path)
+
+def timed_extract(pages):
+    # เวลาที่รอแต่ละหน้าจาก extractor (รวมเวลารอ process pool) นับเป็น stage "extract"
+    pages = iter(pages)
+    while True:
+        started = time.perf_counter()
+        page = next(pages, None)
+        if page is None:
+            return
+        metrics.record("extract", time.perf_counter() - started)
+        metrics.record_pages_extracted()
+        yield page
+
+def iter_clean_pages(pdf, start: int, end: int, skip=frozenset()):
+    page_nums = [page_num for page_num in range(start, end + 1) if page_num not in skip]
+    for page_num, raw_text, _ in timed_extract(pdf.iter_extract(page_nums)):
+        if raw_text and raw_text.strip():
+            yield page_num, clean_thai_pdf_text(raw_text)
+        else:
+            yield page_num, None
+
+class PdfSource:
+    """Page source reading straight from an uploaded PDF."""
+
+    def __init__(self, pdf, filename: str, document_id: str, spool=None):
+        self.pdf = pdf
+        self.filename = filename
+        self.document_id = document_id
+        self.total_pages = pdf.page_count
+        self.spool = spool
+
+    def iter_pages(self, start: int, end: int, skip=frozenset()):
+        return iter_clean_pages(self.pdf, start, end, skip)
+
+    def iter_headers(self, start: int = 1, end: int = None):
+        return iter_clean_headers(self.pdf, start, end)
+
+    def sample_pages(self, count: int) -> list:
+        page_nums = sample_page_nums(self.total_pages, count)
+        return [clean_thai_pdf_text(text) for _, text, _ in self.pdf.iter_extract(page_nums)]
+
+    def close(self):
+        self.pdf.close()
+        if self.spool is not None:
+            self.spool.discard()
+
+async def open_page_source(file: UploadFile, document_id: str):
+    # ใช้เอกสารที่อัปโหลดไว้แล้วผ่าน POST /documents ถ้ามี document_id ไม่งั้นอ่านจากไฟล์ที่แนบมา
+    if document_id:
+        source = document_store.open(document_id)
+        if source is None:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        return source
+    if file is None:
+        raise HTTPException(status_code=400, detail="Either file or document_id is required")
+    if not file.filename.endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="This is not a PDF file")
+    spool, doc_id = await spool_upload(file)
+    try:
+        pdf = await run_in_threadpool(_open_pdf, spool.path)
+    except MemoryLimitError as e:
+        spool.discard()
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        spool.discard()
+        print(f"ERROR: {e}", flush=True)
+        raise HTTPException(status_code=500, detail=f"PDF Error: {e}")
+    return PdfSource(pdf, file.filename, doc_id, spool)
+
+async def check_page_range(source, start: int, end: int):
+    if start < 1 or source.total_pages < end:
+        await run_in_threadpool(source.close)
+        if start < 1:
+            raise HTTPException(status_code=400, detail="Start page must be at least 1")
+        raise HTTPException(status_code=400, detail=f"PDF has only {source.total_pages} pages")
+
+def detect_running_lines(source) -> frozenset:
+    # หาครั้งเดียวต่อเอกสาร: อ่านหน้าตัวอย่างจาก PDF ที่ยาวใช้เวลาหลายวินาที
+    keys = document_store.load_running_lines(source.document_id, RUNNING_LINES_VARIANT)
+    if keys is not None:
+        return keys
+    with metrics.timed("running_lines"):
+        pages = [text for text in source.sample_pages(RUNNING_LINES_SAMPLE_PAGES) if text]
+        keys = running_lines.find_running_lines(pages)
+    document_store.save_running_lines(source.document_id, RUNNING_LINES_VARIANT, keys)
+    print(f"   >> Running headers/footers: {len(keys)} found in {len(pages)} sample pages", flush=True)
+    return keys
+
+async def iter_corrected_pages(source, start: int, end: int, workers: int, running: frozenset = None):
+    # หน้าที่เคยแก้เสร็จแล้ว (checkpoint ตาม hash ของไฟล์ + เลขหน้า) ไม่ต้องทำซ้ำ
+    variant = f"{OLLAMA_MODEL}:{CORRECTION_VARIANT}:{thai_normalizer.VERSION}:{int(LLM_SKIP_VALID_PAGES)}"
+    if STRIP_RUNNING_LINES:
+        variant += f":rl{int(RESTORE_RUNNING_LINES)}"
+    done = await run_in_threadpool(document_store.load_results, source.document_id, variant, start, end)
+    if done:
+        print(f"   >> Resuming: {len(done)} of {end - start + 1} pages already corrected", flush=True)
+
+    async def checkpoint(page_num, corrected_chunk):
+        with metrics.timed("checkpoint"):
+            await run_in_threadpool(document_store.save_result, source.document_id, variant, page_num, corrected_chunk)
+
+    skip = frozenset(done)
+    if running is None:
+        running = frozenset()
+        if STRIP_RUNNING_LINES and len(skip) < end - start + 1:
+            running = await run_in_threadpool(detect_running_lines, source)
+    pages = pipeline_pages(
+        lambda: source.iter_pages(start, end, skip), make_page_corrector(workers, running),
+        workers * LLM_PACK_MAX_PAGES, on_result=checkpoint
+    )
+    async with aclosing(pages):
+        for page_num in range(start, end + 1):
+            if page_num in done:
+                corrected_chunk = done[page_num]
+            else:
+                page_num, corrected_chunk = await anext(pages)
+            if corrected_chunk is None:
+                print(f"   >> Page {page_num} is empty or image only.", flush=True)
+            else:
+                print(corrected_chunk)
+            yield page_num, corrected_chunk
+
+def ndjson_line(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+async def stream_corrected_pages(source, start: int, end: int, workers: int, header: dict, start_time: float, stages,
+                                 endpoint: str = "process-pdf"):
+    metrics.use_breakdown(stages)
+    try:
+        yield ndjson_line({"type": "start", **header})
+        async for page_num, corrected_chunk in iter_corrected_pages(source, start, end, workers):
+            yield ndjson_line({
+                "type": "page",
+                "page": page_num,
+                "empty": corrected_chunk is None,
+                "text": corrected_chunk if corrected_chunk is not None else "[Empty Page]",
+            })
+        duration = time.perf_counter() - start_time
+        print(f"Total time use: {duration:.2f} seconds", flush=True)
+        metrics.REQUEST_SECONDS.labels(endpoint).observe(duration)
+        yield ndjson_line({"type": "done", "processing_time_seconds": round(duration, 2), "stages": stages.as_dict()})
+    except Exception as e:
+        # header ส่งไปแล้ว เปลี่ยน status code ไม่ได้ จึงแจ้ง error เป็น event แทน
+        detail = e.detail if isinstance(e, HTTPException) else f"PDF Error: {e}"
+        print(f"ERROR: {detail}", flush=True)
+        yield ndjson_line({"type": "error", "detail": detail})
+    finally:
+        await run_in_threadpool(source.close)
+
 @app.post("/process-pdf/")
 async def upload_and_process_pdf(
-    file: UploadFile = File(...),
+    file: UploadFile = File(None),
     start: int = Form(...),
-    end: int = Form(...) 
+    end: int = Form(...),
+    concurrency: int = Form(None),
+    stream: bool = Form(False),
+    document_id: str = Form(None)
 ):
     print(f"\n========== NEW REQUEST ==========", flush=True)
     print(f"DEBUG: Received request -> Start: {start}, End: {end}", flush=True)
 
-    if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="This is not a PDF file")
-    
-    file_content = await file.read()
-    corrected_pages_list = [] 
-    total_pages = 0
+    workers = max(1, concurrency or OLLAMA_CONCURRENCY)
     start_time = time.perf_counter()
+    stages = metrics.start_breakdown()
     
+    source = await open_page_source(file, document_id)
+    await check_page_range(source, start, end)
+    return await respond_corrected_pages(source, start, end, workers, stream, start_time, stages)
+
+async def respond_corrected_pages(source, start: int, end: int, workers: int, stream: bool, start_time: float, stages,
+                                  extra: dict = None, endpoint: str = "process-pdf"):
+    corrected_pages_list = [] 
+    total_pages = source.total_pages
+
+    if stream:
+        # ส่งผลทีละหน้าเป็น NDJSON ทันทีที่แก้เสร็จ ไม่ต้องรอทั้งช่วง
+        header = {
+            "filename": source.filename,
+            "pages_processed": f"{start}-{end}",
+            "total_pages_in_pdf": total_pages,
+            "concurrency": workers,
+            **(extra or {}),
+        }
+        return StreamingResponse(
+            stream_corrected_pages(source, start, end, workers, header, start_time, stages, endpoint),
+            media_type="application/x-ndjson"
+        )
+
     try:
-        with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-            total_pages = len(pdf.pages)
-            if start < 1:
-                 raise HTTPException(status_code=400, detail="Start page must be at least 1")
-            if total_pages < end:
-                raise HTTPException(status_code=400, detail=f"PDF has only {total_pages} pages")
-
-            for page_num in range(start, end + 1):
-                page_index = page_num - 1     
-                if 0 <= page_index < total_pages:
-                    raw_text = pdf.pages[page_index].extract_text()
-                    
-                    if raw_text and raw_text.strip():
-                        # print(f"   >> Processing Page {page_num}...", flush=True)
-                        clean_raw_text = clean_thai_pdf_text(raw_text)
-                        corrected_chunk = process_text_with_ollama(clean_raw_text)  
-                        print(corrected_chunk)
-                        formatted_output = f"--- Page {page_num} ---\n{corrected_chunk}\n"
-                        corrected_pages_list.append(formatted_output)
-                    else:
-                        print(f"   >> Page {page_num} is empty or image only.", flush=True)
-                        corrected_pages_list.append(f"--- Page {page_num} ---\n[Empty Page]\n")
+        async for page_num, corrected_chunk in iter_corrected_pages(source, start, end, workers):
+            if corrected_chunk is None:
+                corrected_pages_list.append(f"--- Page {page_num} ---\n[Empty Page]\n")
+            else:
+                formatted_output = f"--- Page {page_num} ---\n{corrected_chunk}\n"
+                corrected_pages_list.append(formatted_output)
     except HTTPException as he:
         raise he
+    except MemoryLimitError as e:
+        print(f"ERROR: {e}", flush=True)
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"ERROR: {e}", flush=True)
         raise HTTPException(status_code=500, detail=f"PDF Error: {e}")
+    finally:
+        await run_in_threadpool(source.close)
     final_corrected_text = "\n".join(corrected_pages_list)
     end_time = time.perf_counter()
     duration = end_time - start_time
     print(f"Total time use: {duration:.2f} seconds", flush=True)
+    metrics.REQUEST_SECONDS.labels(endpoint).observe(duration)
     
     return {
-        "filename": file.filename,
+        "filename": source.filename,
         "pages_processed": f"{start}-{end}",
         "total_pages_in_pdf": total_pages,
         "processing_time_seconds": round(duration, 2),
+        "concurrency": workers,
+        **(extra or {}),
+        "stages": stages.as_dict(),
         "corrected_text": final_corrected_text
     }
+
+@app.post("/process-chapters/")
+async def process_chapters(
+    file: UploadFile = File(None),
+    start_chapter: int = Form(...),
+    end_chapter: int = Form(None),
+    concurrency: int = Form(None),
+    stream: bool = Form(False),
+    document_id: str = Form(None)
+):
+    # แก้เฉพาะหน้าของตอนที่ขอ: หาช่วงหน้าจาก chapter index (scan เฉพาะหน้าที่ยังไม่เคย index)
+    end_chapter = start_chapter if end_chapter is None else end_chapter
+    print(f"\n========== PROCESS CHAPTERS {start_chapter} to {end_chapter} ==========", flush=True)
+
+    workers = max(1, concurrency or OLLAMA_CONCURRENCY)
+    start_time = time.perf_counter()
+    stages = metrics.start_breakdown()
+
+    source = await open_page_source(file, document_id)
+    try:
+        chapters = [
+            {k: event[k] for k in ("chapter", "start_page", "end_page")}
+            async for event in iter_chapter_events(source)
+            if event["type"] == "chapter" and start_chapter <= event["chapter"] <= end_chapter
+        ]
+    except Exception as e:
+        await run_in_threadpool(source.close)
+        if isinstance(e, HTTPException):
+            raise
+        print(f"ERROR: {e}", flush=True)
+        raise HTTPException(status_code=500, detail=f"Processing Error: {e}")
+    if not chapters:
+        await run_in_threadpool(source.close)
+        raise HTTPException(status_code=404, detail=f"Chapter {start_chapter} - {end_chapter} not found")
+
+    start = min(c["start_page"] for c in chapters)
+    end = max(c["end_page"] for c in chapters)
+    print(f"   >> Chapters {start_chapter}-{end_chapter} are pages {start}-{end}", flush=True)
+    return await respond_corrected_pages(
+        source, start, end, workers, stream, start_time, stages,
+        extra={"chapters": chapters}, endpoint="process-chapters"
+    )
     
-def fix_header_with_ollama(header_text: str) -> str:
+async def fix_header_with_ollama(header_text: str) -> str:
+    cache_key = llm_cache.make_key("header", OLLAMA_MODEL, HEADER_PROMPT_VERSION, header_text)
+    cached = await run_in_threadpool(llm_cache.get, "header", cache_key)
+    if cached is not None:
+        return cached
     prompt = (
         f"Correct Thai text errors. Focus on identifying chapter titles like 'ตอนที่'.\n"
         f"Input: {header_text}\n"
         f"Output ONLY the corrected text line."
     )
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "num_predict": 50,  
-            "temperature": 0.1 
-        }
-    }
+    call_start = time.perf_counter()
     try:
-        response = requests.post(
-            OLLAMA_API_URL, 
-            headers={"Content-Type": "application/json"}, 
-            data=json.dumps(payload),
-            timeout=120 
-        )
-        response.raise_for_status()
-        result = response.json()
-        return result['response'].strip()
+        result = await ollama.agenerate(prompt, OLLAMA_MODEL, preset="header", timeout=120, priority=scheduler.INTERACTIVE)
+        metrics.record_llm("header", result, time.perf_counter() - call_start)
+        corrected = result['response'].strip()
     except Exception as e:
+        metrics.record_llm_error("header", time.perf_counter() - call_start)
         print(f"Ollama Error (Header): {e}")
         return header_text 
+    await run_in_threadpool(llm_cache.put, "header", cache_key, corrected)
+    return corrected
+
+HEADER_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "line": {"type": "integer"},
+                    "chapter": {"type": ["integer", "null"]}
+                },
+                "required": ["line", "chapter"]
+            }
+        }
+    },
+    "required": ["results"]
+}
+
+async def fix_headers_batch_with_ollama(header_texts: list) -> list:
+    """Ask for the chapter number of many headers in one structured-output call."""
+    numbered = "\n".join(f"{i + 1}. {text}" for i, text in enumerate(header_texts))
+    prompt = (
+        f"Each numbered line is the top of a page from a Thai novel and may contain Thai vowel and tone mark encoding errors.\n"
+        f"For every line, decide whether it contains a chapter title like 'ตอนที่ 12'. "
+        f"Give the chapter number as an integer (convert Thai numerals and spelled-out numbers), or null if there is no chapter title.\n"
+        f"{numbered}\n"
+        f"Answer with JSON only: one result per line number."
+    )
+    call_start = time.perf_counter()
+    try:
+        response = await ollama.agenerate(
+            prompt, OLLAMA_MODEL, preset="header-batch",
+            options={"num_predict": 20 * len(header_texts) + 50},
+            format=HEADER_BATCH_SCHEMA, timeout=120, priority=scheduler.INTERACTIVE
+        )
+    except OllamaError:
+        metrics.record_llm_error("header-batch", time.perf_counter() - call_start)
+        raise
+    metrics.record_llm("header-batch", response, time.perf_counter() - call_start)
+    results = json.loads(response['response'])["results"]
+    chapters = [None] * len(header_texts)
+    for item in results:
+        line = item.get("line")
+        if isinstance(line, int) and 1 <= line <= len(header_texts) and isinstance(item.get("chapter"), int):
+            chapters[line - 1] = item["chapter"]
+    for text, chapter in zip(header_texts, chapters):
+        cache_key = llm_cache.make_key("header-batch", OLLAMA_MODEL, HEADER_BATCH_PROMPT_VERSION, text)
+        await run_in_threadpool(llm_cache.put, "header-batch", cache_key, "" if chapter is None else str(chapter))
+    return chapters
+
+async def resolve_headers_batch(header_texts: list) -> list:
+    try:
+        return await fix_headers_batch_with_ollama(header_texts)
+    except Exception as e:
+        # batch ใช้ไม่ได้ (เช่น Ollama รุ่นเก่าไม่รองรับ format schema) -> แก้ทีละบรรทัดแบบเดิม
+        print(f"Ollama Error (Header batch): {e}", flush=True)
+        corrected = await asyncio.gather(*(fix_header_with_ollama(text) for text in header_texts))
+        return [chapter_headers.parse_chapter_number(text) for text in corrected]
+
+def make_header_resolver(stats: dict):
+    # ขั้นแรกใช้ regex/fuzzy ราคาถูก ส่ง LLM เฉพาะ header ที่ไม่ชัดเจน และรวมเป็น batch
+    batcher = MicroBatcher(resolve_headers_batch, max_batch=HEADER_BATCH_SIZE)
+
+    async def resolve(header_text: str):
+        kind, chapter = chapter_headers.classify_header(header_text)
+        stats[kind] += 1
+        if kind != "ambiguous":
+            return chapter
+        cache_key = llm_cache.make_key("header-batch", OLLAMA_MODEL, HEADER_BATCH_PROMPT_VERSION, header_text)
+        cached = await run_in_threadpool(llm_cache.get, "header-batch", cache_key)
+        if cached is not None:
+            return int(cached) if cached else None
+        chapter = await batcher.submit(header_text)
+        stats["llm_batches"] = batcher.batches
+        return chapter
+
+    return resolve
+
+def clean_header_text(raw_text):
+    # 1. Text แค่ส่วนบน 20% ของหน้า (pdf_extract crop ให้แล้ว ไม่ต้อง extract ทั้งหน้า)
+    if not raw_text or not raw_text.strip():
+        return None
+
+    # 2. Clean เบื้องต้น
+    cleaned_text = clean_thai_pdf_text(raw_text)
+    # ตัดเอาแค่ 100 ตัวอักษรแรกเพื่อส่ง AI (ประหยัดเวลา)
+    return cleaned_text[:150].replace('\n', ' ')
+
+def iter_clean_headers(pdf, start: int = 1, end: int = None):
+    # 3. ส่งให้ Ollama แก้ไข (ทำใน pipeline_pages)
+    pages = pdf.iter_extract(range(start, (end or pdf.page_count) + 1), body=False, header=True)
+    for page_num, _, raw_header in timed_extract(pages):
+        yield page_num, clean_header_text(raw_header)
+
+def header_fingerprint(header_text) -> str:
+    return hashlib.sha1((header_text or "").encode("utf-8")).hexdigest()[:16]
+
+def _source_fingerprint(source, page_num: int) -> str:
+    for _, header_text in source.iter_headers(page_num, page_num):
+        return header_fingerprint(header_text)
+
+def resume_chapter_index(source) -> int:
+    """Number of leading pages of `source` already in the chapter index.
+
+    A document scanned before is used as is. Otherwise a shorter indexed
+    document whose first, middle and last indexed pages match this one (the
+    same book with chapters appended) lends its index for those pages.
+    """
+    scanned = document_store.scanned_pages(source.document_id, CHAPTER_INDEX_VARIANT)
+    if scanned:
+        return min(scanned, source.total_pages)
+    first = _source_fingerprint(source, 1)
+    for old_doc, old_scanned in document_store.prefix_candidates(CHAPTER_INDEX_VARIANT, first, source.total_pages):
+        if all(
+            _source_fingerprint(source, page_num) == document_store.page_fingerprint(old_doc, CHAPTER_INDEX_VARIANT, page_num)
+            for page_num in {(old_scanned + 1) // 2, old_scanned}
+        ):
+            document_store.copy_chapter_pages(old_doc, source.document_id, CHAPTER_INDEX_VARIANT, old_scanned)
+            print(f"   >> Chapter index: pages 1-{old_scanned} match document {old_doc[:12]}, scanning the rest", flush=True)
+            return old_scanned
+    return 0
+
+async def iter_chapter_pages(source, on_page=None):
+    # (page_num, chapter หรือ None): หน้าที่ index ไว้แล้วอ่านจาก document store, ที่เหลือ scan header แล้วเก็บลง index
+    doc_id = source.document_id
+    indexed = await run_in_threadpool(resume_chapter_index, source)
+    for page_num, chapter in await run_in_threadpool(document_store.chapter_starts, doc_id, CHAPTER_INDEX_VARIANT):
+        if page_num <= indexed:
+            yield page_num, chapter
+    if indexed:
+        print(f"   >> Chapter index: {indexed} of {source.total_pages} pages already indexed", flush=True)
+        if on_page is not None:
+            await on_page(indexed)
+    if indexed >= source.total_pages:
+        return
+
+    fingerprints = {}
+
+    def headers():
+        for page_num, header_text in source.iter_headers(indexed + 1):
+            fingerprints[page_num] = header_fingerprint(header_text)
+            yield page_num, header_text
+
+    # 4. ใช้ Regex หาคำว่า "ตอนที่ <ตัวเลข>" ก่อน ส่ง LLM เป็น batch เฉพาะ header ที่ไม่ชัดเจน
+    stats = {"chapter": 0, "none": 0, "ambiguous": 0, "llm_batches": 0}
+    resolve = make_header_resolver(stats)
+    rows = []
+    # lookahead ต้องมากพอให้ header ที่ไม่ชัดเจนรวมกันได้เต็ม batch
+    scanned = pipeline_pages(headers, resolve, HEADER_BATCH_SIZE * OLLAMA_CONCURRENCY)
+    async with aclosing(scanned):
+        async for page_num, chapter in scanned:
+            rows.append((page_num, fingerprints.pop(page_num), chapter))
+            if on_page is not None:
+                await on_page(page_num)
+            yield page_num, chapter
+
+    print(
+        f"Header prefilter: {stats['chapter']} by regex, {stats['none']} skipped, "
+        f"{stats['ambiguous']} ambiguous in {stats['llm_batches']} LLM batches",
+        flush=True
+    )
+    await run_in_threadpool(document_store.save_chapter_pages, doc_id, CHAPTER_INDEX_VARIANT, rows)
+
+async def iter_chapter_events(source, on_page=None):
+    """Yield chapter events from the chapter index, scanning pages not indexed yet.
+
+    Yields {"type": "chapter_start", ...} when a chapter heading is found and
+    {"type": "chapter", ...} with the full page range once the next heading
+    (or the end of the file) closes it. `on_page(page_num)` is awaited once
+    all pages up to `page_num` are known, for progress reporting.
+    """
+    total_pages = source.total_pages
+
+    # ตัวแปรช่วยในการ Mapping
+    current_chapter_num = None
+    current_chapter_start_page = None
+
+    # วนลูปทุกหน้าเพื่อหาจุดขึ้นต้นตอนใหม่ (อ่าน header ใน thread)
+    pages = iter_chapter_pages(source, on_page)
+    async with aclosing(pages):
+        async for page_num, found_chap_num in pages:
+        
+            if found_chap_num is not None:
+                print(f" -> Found Chapter {found_chap_num} at Page {page_num}", flush=True)
+
+                # --- LOGIC การตัดจบตอนเก่า ---
+                if current_chapter_num is not None:
+                    # หน้าจบของตอนเก่า คือ หน้าก่อนหน้าปัจจุบัน (page_num - 1)
+                    yield {
+                        "type": "chapter",
+                        "chapter": current_chapter_num,
+                        "start_page": current_chapter_start_page,
+                        "end_page": page_num - 1
+                    }
+            
+                # เริ่มต้นตอนใหม่
+                current_chapter_num = found_chap_num
+                current_chapter_start_page = page_num
+                yield {"type": "chapter_start", "chapter": found_chap_num, "start_page": page_num}
+
+    # 5. จัดการตอนสุดท้าย (เพราะวนลูปจบแล้ว แต่ตอนสุดท้ายยังไม่ได้บันทึก end_page)
+    if current_chapter_num is not None:
+        yield {
+            "type": "chapter",
+            "chapter": current_chapter_num,
+            "start_page": current_chapter_start_page,
+            "end_page": total_pages # จบที่หน้าสุดท้ายของไฟล์
+        }
+
+async def stream_chapter_events(source, start_chapter: int, end_chapter: int, header: dict, start_time: float, stages):
+    metrics.use_breakdown(stages)
+    try:
+        yield ndjson_line({"type": "start", **header})
+        async for event in iter_chapter_events(source):
+            if start_chapter <= event["chapter"] <= end_chapter:
+                yield ndjson_line(event)
+        duration = time.perf_counter() - start_time
+        print(f"Mapping finished in {duration:.2f} seconds")
+        metrics.REQUEST_SECONDS.labels("map-chapters").observe(duration)
+        yield ndjson_line({"type": "done", "processing_time": f"{duration:.2f}s", "stages": stages.as_dict()})
+    except Exception as e:
+        print(f"ERROR: {e}", flush=True)
+        yield ndjson_line({"type": "error", "detail": f"Processing Error: {e}"})
+    finally:
+        await run_in_threadpool(source.close)
 
 @app.post("/map-chapters/")
 async def map_chapters(
-    file: UploadFile = File(...),
+    file: UploadFile = File(None),
     start_chapter: int = Form(...),
-    end_chapter: int = Form(...)
+    end_chapter: int = Form(...),
+    stream: bool = Form(False),
+    document_id: str = Form(None)
 ):
     print(f"\n========== MAPPING CHAPTERS {start_chapter} to {end_chapter} ==========", flush=True)
     
-    if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="This is not a PDF file")
-
-    file_content = await file.read()
-    
     found_chapters = []  # เก็บผลลัพธ์: [{'chapter': 1, 'start_page': 3, 'end_page': 5}, ...]
     
-    # ตัวแปรช่วยในการ Mapping
-    current_chapter_num = None
-    current_chapter_start_page = None
-    
     start_time = time.perf_counter()
+    stages = metrics.start_breakdown()
 
-    try:
-        with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-            total_pages = len(pdf.pages)
-            
-            # วนลูปทุกหน้าเพื่อหาจุดขึ้นต้นตอนใหม่
-            for i, page in enumerate(pdf.pages):
-                page_num = i + 1
-                
-                # 1. ดึง Text แค่ส่วนบน (ประมาณ 1/4 หน้าบน หรือ 3-4 บรรทัดแรก)
-                # ใช้ crop เพื่อความเร็วและแม่นยำ ไม่ต้อง extract ทั้งหน้า
-                width = page.width
-                height = page.height
-                header_crop = page.crop((0, 0, width, height * 0.2)) # ตัดมาแค่ 20% ด้านบน
-                
-                raw_text = header_crop.extract_text()
-                
-                if not raw_text or not raw_text.strip():
-                    continue
+    source = await open_page_source(file, document_id)
+    total_pages = source.total_pages
 
-                # 2. Clean เบื้องต้น
-                cleaned_text = clean_thai_pdf_text(raw_text)
-                # ตัดเอาแค่ 100 ตัวอักษรแรกเพื่อส่ง AI (ประหยัดเวลา)
-                short_header = cleaned_text[:150].replace('\n', ' ') 
-
-                # 3. ส่งให้ Ollama แก้ไข
-                corrected_header = fix_header_with_ollama(short_header)
-                
-                # 4. ใช้ Regex หาคำว่า "ตอนที่ <ตัวเลข>"
-                # รองรับกรณีเว้นวรรค เช่น "ตอน ที่ 1" หรือ "ตอนที่1"
-                match = re.search(r'ตอน\s*ที่\s*(\d+)', corrected_header)
-                
-                if match:
-                    found_chap_num = int(match.group(1))
-                    print(f" -> Found Chapter {found_chap_num} at Page {page_num}", flush=True)
-
-                    # --- LOGIC การตัดจบตอนเก่า ---
-                    if current_chapter_num is not None:
-                        # บันทึกตอนเก่าลง list
-                        # หน้าจบของตอนเก่า คือ หน้าก่อนหน้าปัจจุบัน (page_num - 1)
-                        found_chapters.append({
-                            "chapter": current_chapter_num,
-                            "start_page": current_chapter_start_page,
-                            "end_page": page_num - 1
-                        })
-                    
-                    # เริ่มต้นตอนใหม่
-                    current_chapter_num = found_chap_num
-                    current_chapter_start_page = page_num
-            
-            # 5. จัดการตอนสุดท้าย (เพราะวนลูปจบแล้ว แต่ตอนสุดท้ายยังไม่ได้บันทึก end_page)
-            if current_chapter_num is not None:
-                found_chapters.append({
-                    "chapter": current_chapter_num,
-                    "start_page": current_chapter_start_page,
-                    "end_page": total_pages # จบที่หน้าสุดท้ายของไฟล์
-                })
+    if stream:
+        # ส่งแต่ละตอนออกไปทันทีที่เจอ แทนการรอ scan ครบทั้งไฟล์
+        header = {
+            "filename": source.filename,
+            "request_range": f"Chapter {start_chapter} - {end_chapter}",
+            "total_pages_scanned": total_pages,
+        }
+        return StreamingResponse(
+            stream_chapter_events(source, start_chapter, end_chapter, header, start_time, stages),
+            media_type="application/x-ndjson"
+        )
 
+    try:
+        async for event in iter_chapter_events(source):
+            if event["type"] == "chapter":
+                found_chapters.append({k: event[k] for k in ("chapter", "start_page", "end_page")})
+    except MemoryLimitError as e:
+        print(f"ERROR: {e}", flush=True)
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"ERROR: {e}", flush=True)
         raise HTTPException(status_code=500, detail=f"Processing Error: {e}")
+    finally:
+        await run_in_threadpool(source.close)
 
     # 6. Filter เอาเฉพาะช่วงตอนที่ User ต้องการ
     filtered_result = [
@@ -245,15 +826,464 @@ async def map_chapters(
 
     duration = time.perf_counter() - start_time
     print(f"Mapping finished in {duration:.2f} seconds")
+    metrics.REQUEST_SECONDS.labels("map-chapters").observe(duration)
 
     return {
-        "filename": file.filename,
+        "filename": source.filename,
         "request_range": f"Chapter {start_chapter} - {end_chapter}",
         "total_pages_scanned": total_pages,
         "processing_time": f"{duration:.2f}s",
+        "stages": stages.as_dict(),
         "chapters": filtered_result
     }
     
+def _ingest_document(doc_id: str, filename: str):
+    pdf = PdfExtractor(document_store.pdf_path(doc_id))
+    try:
+        def pages():
+            pages = pdf.iter_extract(range(1, pdf.page_count + 1), header=True)
+            for page_num, raw_text, raw_header in timed_extract(pages):
+                text = clean_thai_pdf_text(raw_text) if raw_text and raw_text.strip() else None
+                yield page_num, text, clean_header_text(raw_header)
+
+        document_store.save_pages(doc_id, filename, pdf.page_count, pages())
+    finally:
+        pdf.close()
+    return document_store.info(doc_id)
+
+async def ensure_document(doc_id: str, filename: str):
+    info = document_store.info(doc_id)
+    if info is not None:
+        return info
+    start_time = time.perf_counter()
+    info = await run_in_threadpool(_ingest_document, doc_id, filename)
+    duration = time.perf_counter() - start_time
+    print(f"Stored document {doc_id} ({info['total_pages']} pages) in {duration:.2f} seconds", flush=True)
+    return info
+
+async def store_upload(file: UploadFile) -> str:
+    if not file.filename.endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="This is not a PDF file")
+    spool, doc_id = await spool_upload(file)
+    if document_store.has_pdf(doc_id):
+        spool.discard()
+    else:
+        await run_in_threadpool(document_store.save_pdf_file, doc_id, spool)
+    return doc_id
+
+@app.post("/documents")
+async def upload_document(file: UploadFile = File(...)):
+    # อัปโหลดครั้งเดียว แล้วใช้ document_id กับ /process-pdf/ และ /map-chapters/ ได้เลย
+    doc_id = await store_upload(file)
+    already_stored = document_store.info(doc_id) is not None
+    try:
+        info = await ensure_document(doc_id, file.filename)
+    except Exception as e:
+        print(f"ERROR: {e}", flush=True)
+        raise HTTPException(status_code=500, detail=f"PDF Error: {e}")
+    return {**info, "already_stored": already_stored}
+
+@app.get("/documents/{document_id}")
+def get_document(document_id: str):
+    info = document_store.info(document_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+    return info
+
+async def run_process_job(job_id: str, params: dict):
+    stages = metrics.start_breakdown()
+    scheduler.use_client(params.get("client"))
+    await ensure_document(params["document_id"], params["filename"])
+    source = document_store.open(params["document_id"])
+    start, end = params["start"], params["end"]
+    await check_page_range(source, start, end)
+    await run_in_threadpool(job_store.set_total, job_id, end - start + 1)
+    async for page_num, corrected_chunk in iter_corrected_pages(source, start, end, params["concurrency"]):
+        await run_in_threadpool(job_store.record_page, job_id, page_num, corrected_chunk)
+    metrics.REQUEST_SECONDS.labels("job:process-pdf").observe(time.perf_counter() - stages.started)
+    return {"pages_processed": f"{start}-{end}", "total_pages_in_pdf": source.total_pages, "stages": stages.as_dict()}
+
+async def run_map_job(job_id: str, params: dict):
+    stages = metrics.start_breakdown()
+    scheduler.use_client(params.get("client"))
+    await ensure_document(params["document_id"], params["filename"])
+    source = document_store.open(params["document_id"])
+    await run_in_threadpool(job_store.set_total, job_id, source.total_pages)
+
+    progress = 0
+
+    async def on_page(page_num):
+        nonlocal progress
+        await run_in_threadpool(job_store.advance, job_id, page_num - progress)
+        progress = page_num
+
+    chapters = []
+    async for event in iter_chapter_events(source, on_page=on_page):
+        if event["type"] == "chapter" and params["start_chapter"] <= event["chapter"] <= params["end_chapter"]:
+            chapters.append({k: event[k] for k in ("chapter", "start_page", "end_page")})
+    metrics.REQUEST_SECONDS.labels("job:map-chapters").observe(time.perf_counter() - stages.started)
+    return {
+        "request_range": f"Chapter {params['start_chapter']} - {params['end_chapter']}",
+        "total_pages_scanned": source.total_pages,
+        "stages": stages.as_dict(),
+        "chapters": chapters,
+    }
+
+# audiobook: หน้าที่แก้แล้วรอ TTS ได้ไม่เกินกี่หน้า (เต็มแล้วการแก้หน้าหยุดรอ = back-pressure ไปถึงการอ่าน PDF)
+AUDIOBOOK_QUEUE_PAGES = int(os.environ.get("AUDIOBOOK_QUEUE_PAGES", "8"))
+AUDIO_DIR = os.environ.get("AUDIO_DIR", "jobs/audio")
+AUDIOBOOK_STAGES = ("extract", "clean", "llm", "tts", "encode", "backpressure", "tts_idle")
+
+async def run_audiobook_job(job_id: str, params: dict):
+    """PDF chapters to one audio file per chapter, every stage running at once.
+
+    extract -> clean -> LLM correction run as in /process-pdf/ (pipeline_pages);
+    corrected pages go through a bounded queue to the TTS stage, which
+    appends each page to its chapter's file and publishes the chapter as soon
+    as its last page is voiced. Ollama (GPU) and TTS (CPU) work in parallel.
+    """
+    stages = metrics.start_breakdown()
+    scheduler.use_client(params.get("client"))
+    if not tts_model.loaded:
+        raise HTTPException(status_code=503, detail="TTS model is not loaded")
+    await ensure_document(params["document_id"], params["filename"])
+    source = document_store.open(params["document_id"])
+
+    chapters = [
+        {k: event[k] for k in ("chapter", "start_page", "end_page")}
+        async for event in iter_chapter_events(source)
+        if event["type"] == "chapter" and params["start_chapter"] <= event["chapter"] <= params["end_chapter"]
+    ]
+    if not chapters:
+        raise HTTPException(
+            status_code=404, detail=f"Chapter {params['start_chapter']} - {params['end_chapter']} not found"
+        )
+    start = min(c["start_page"] for c in chapters)
+    end = max(c["end_page"] for c in chapters)
+    chapter_of = {page: c for c in chapters for page in range(c["start_page"], c["end_page"] + 1)}
+    await run_in_threadpool(job_store.set_total, job_id, end - start + 1)
+    # ชื่อเรื่อง / เลขหน้าที่ใส่กลับในข้อความที่แก้แล้ว ไม่ต้องอ่านออกเสียง
+    running = await run_in_threadpool(detect_running_lines, source) if STRIP_RUNNING_LINES else frozenset()
+    fmt, speaker = params["format"], params.get("speaker")
+    pages = asyncio.Queue(maxsize=AUDIOBOOK_QUEUE_PAGES)
+
+    async def correct():
+        async for page_num, corrected_chunk in iter_corrected_pages(source, start, end, params["concurrency"], running):
+            with metrics.timed("backpressure"):
+                await pages.put((page_num, corrected_chunk))
+        await pages.put(None)
+
+    def voice(writer, text):
+        with metrics.timed("tts"):
+            pcm, _ = synthesizer.synthesize(text, speaker)
+        with metrics.timed("encode"):
+            writer.write(pcm + synthesizer.silence(tts_engine.TTS_LINE_PAUSE))
+
+    async def speak():
+        writer = None
+        try:
+            while True:
+                with metrics.timed("tts_idle"):
+                    item = await pages.get()
+                if item is None:
+                    return
+                page_num, corrected_chunk = item
+                chapter = chapter_of.get(page_num)
+                if chapter is None:
+                    continue
+                if writer is None:
+                    path = os.path.join(AUDIO_DIR, job_id, f"chapter-{chapter['chapter']:04d}{audio_encode.EXTENSIONS[fmt]}")
+                    writer = audio_encode.AudioFileWriter(path, fmt, tts_model.sample_rate)
+                text = running_lines.strip_running_lines(corrected_chunk, running)[0] if corrected_chunk else ""
+                if text.strip():
+                    await run_in_threadpool(voice, writer, text)
+                await run_in_threadpool(job_store.advance, job_id)
+                if page_num == chapter["end_page"]:
+                    await run_in_threadpool(writer.close)
+                    await run_in_threadpool(job_store.record_chapter, job_id, {
+                        **chapter, "path": writer.path, "bytes": writer.bytes,
+                        "audio_seconds": round(writer.samples / tts_model.sample_rate, 2),
+                    })
+                    print(f"[job {job_id}] chapter {chapter['chapter']} audio ready: {writer.path}", flush=True)
+                    writer = None
+        finally:
+            if writer is not None:
+                await run_in_threadpool(writer.discard)
+
+    tasks = [asyncio.create_task(correct()), asyncio.create_task(speak())]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await run_in_threadpool(source.close)
+
+    metrics.REQUEST_SECONDS.labels("job:audiobook").observe(time.perf_counter() - stages.started)
+    summary = stages.as_dict()
+    waits = summary["stages"]
+    # การแก้หน้ารอ TTS นานกว่าที่ TTS รอหน้า = TTS เป็นคอขวด และกลับกัน
+    bottleneck = "tts" if waits.get("backpressure", {}).get("seconds", 0) > waits.get("tts_idle", {}).get("seconds", 0) else "correction"
+    return {
+        "request_range": f"Chapter {params['start_chapter']} - {params['end_chapter']}",
+        "pages_processed": f"{start}-{end}",
+        "format": fmt,
+        "stages": summary,
+        "throughput": metrics.throughput(summary, AUDIOBOOK_STAGES),
+        "bottleneck": bottleneck,
+    }
+
+job_runner = JobRunner(
+    job_store,
+    {"process-pdf": run_process_job, "map-chapters": run_map_job, "audiobook": run_audiobook_job},
+    workers=JOB_WORKERS
+)
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+async def submit_job(kind: str, file: UploadFile, document_id: str, params: dict):
+    if document_id:
+        info = document_store.info(document_id)
+        if info is None and not document_store.has_pdf(document_id):
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        filename = info["filename"] if info else f"{document_id}.pdf"
+    elif file is not None:
+        document_id = await store_upload(file)
+        filename = file.filename
+    else:
+        raise HTTPException(status_code=400, detail="Either file or document_id is required")
+    params = {**params, "document_id": document_id, "filename": filename, "client": scheduler.current_client()}
+    job_id = await run_in_threadpool(job_store.submit, kind, params)
+    job_runner.notify()
+    return {"job_id": job_id, "status": "queued", "document_id": document_id}
+
+@app.post("/jobs/process-pdf")
+async def submit_process_job(
+    file: UploadFile = File(None),
+    start: int = Form(...),
+    end: int = Form(...),
+    concurrency: int = Form(None),
+    document_id: str = Form(None)
+):
+    if start < 1:
+        raise HTTPException(status_code=400, detail="Start page must be at least 1")
+    params = {"start": start, "end": end, "concurrency": max(1, concurrency or OLLAMA_CONCURRENCY)}
+    return await submit_job("process-pdf", file, document_id, params)
+
+@app.post("/jobs/map-chapters")
+async def submit_map_job(
+    file: UploadFile = File(None),
+    start_chapter: int = Form(...),
+    end_chapter: int = Form(...),
+    document_id: str = Form(None)
+):
+    params = {"start_chapter": start_chapter, "end_chapter": end_chapter}
+    return await submit_job("map-chapters", file, document_id, params)
+
+@app.post("/jobs/audiobook")
+async def submit_audiobook_job(
+    file: UploadFile = File(None),
+    start_chapter: int = Form(...),
+    end_chapter: int = Form(None),
+    audio_format: str = Form("opus", alias="format"),
+    speaker: str = Form(None),
+    concurrency: int = Form(None),
+    document_id: str = Form(None)
+):
+    if not tts_model.loaded:
+        raise HTTPException(status_code=503, detail="TTS model is not loaded")
+    if speaker and speaker not in tts_model.speakers:
+        raise HTTPException(status_code=400, detail=f"Unknown speaker {speaker!r}, available: {sorted(tts_model.speakers)}")
+    try:
+        audio_encode.check_format(audio_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    params = {
+        "start_chapter": start_chapter,
+        "end_chapter": start_chapter if end_chapter is None else end_chapter,
+        "format": audio_format,
+        "speaker": speaker,
+        "concurrency": max(1, concurrency or OLLAMA_CONCURRENCY),
+    }
+    return await submit_job("audiobook", file, document_id, params)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    job.pop("result")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    # ดึงผลได้แม้งานยังไม่เสร็จ (ได้เฉพาะหน้าที่แก้เสร็จแล้ว)
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    response = {"job_id": job_id, "status": job["status"], "filename": job["params"]["filename"]}
+    if job["kind"] == "process-pdf":
+        corrected_pages_list = [
+            f"--- Page {page_num} ---\n{text if text is not None else '[Empty Page]'}\n"
+            for page_num, text in job_store.pages(job_id)
+        ]
+        response["pages_done"] = len(corrected_pages_list)
+        response["corrected_text"] = "\n".join(corrected_pages_list)
+    if job["kind"] == "audiobook":
+        # ตอนที่เสียงเสร็จแล้ว ดาวน์โหลดได้ทันทีแม้งานยังไม่จบ
+        response["chapters_ready"] = [
+            {**{k: v for k, v in chapter.items() if k != "path"}, "url": f"/jobs/{job_id}/audio/{chapter['chapter']}"}
+            for chapter in job_store.chapters(job_id)
+        ]
+    if job["result"] is not None:
+        response.update(job["result"])
+    return response
+
+@app.get("/jobs/{job_id}/audio/{chapter}")
+def get_job_audio(job_id: str, chapter: int):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    for ready in job_store.chapters(job_id):
+        if ready["chapter"] == chapter:
+            fmt = job["params"]["format"]
+            return FileResponse(
+                ready["path"], media_type=audio_encode.media_type(fmt),
+                filename=f"{os.path.splitext(job['params']['filename'])[0]}-{chapter}{audio_encode.EXTENSIONS[fmt]}"
+            )
+    raise HTTPException(status_code=404, detail=f"Audio of chapter {chapter} is not ready")
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    cancelled = await job_runner.cancel(job_id)
+    return {"job_id": job_id, "cancelled": cancelled}
+
+# โหลดโมเดล TTS ครั้งเดียวตอน start (ใช้เวลาหลายวินาที) ตั้ง TTS_ENABLED=0 ถ้าไม่ใช้ /tts
+TTS_ENABLED = os.environ.get("TTS_ENABLED", "1") == "1"
+tts_model = KhanomTanTTS()
+# เสียงของแต่ละประโยคเก็บไว้ใช้ซ้ำ (ชื่อตอน ชื่อผู้พูด ฯลฯ) ลบอันที่ไม่ได้ใช้นานสุดเมื่อเกิน TTS_CACHE_MAX_MB
+tts_cache = tts_engine.TTSCache(
+    os.environ.get("TTS_CACHE_PATH", "cache/tts_cache.sqlite3"),
+    max_bytes=int(os.environ.get("TTS_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+)
+synthesizer = tts_engine.SpeechSynthesizer(tts_model, tts_cache)
+
+@app.on_event("startup")
+async def load_tts_model():
+    if not TTS_ENABLED:
+        return
+    try:
+        await run_in_threadpool(tts_model.load)
+    except Exception as e:
+        # ไม่มี torch/TTS หรือไฟล์โมเดล: ส่วนอื่นยังใช้ได้ /tts ตอบ 503
+        print(f"TTS model not loaded: {e!r}", flush=True)
+        return
+    print(f"TTS model loaded in {tts_model.load_seconds:.1f}s ({tts_model.threads} threads)", flush=True)
+    try:
+        await run_in_threadpool(synthesizer.start)
+    except Exception as e:
+        # worker โหลดโมเดลไม่ได้: สังเคราะห์ด้วยโมเดลใน process นี้อย่างเดียว
+        print(f"TTS pool not started, synthesizing in-process: {e!r}", flush=True)
+        tts_engine.shutdown_pool()
+        synthesizer.processes = 1
+
+@app.on_event("shutdown")
+async def close_tts():
+    tts_engine.shutdown_pool()
+    tts_cache.close()
+
+def stream_speech(text: str, speaker: str, fmt: str):
+    # generator ธรรมดา: StreamingResponse รันใน threadpool ทีละ chunk, encode ทีละประโยคแล้วส่งทันที
+    encoder = audio_encode.AudioEncoder(fmt, tts_model.sample_rate)
+    started = time.perf_counter()
+    sent = 0
+    for pcm in synthesizer.iter_synthesize(text, speaker):
+        with metrics.timed("encode"):
+            chunk = encoder.encode(pcm)
+        if chunk:
+            sent += len(chunk)
+            yield chunk
+    tail = encoder.finish()
+    sent += len(tail)
+    yield tail
+    duration = time.perf_counter() - started
+    metrics.REQUEST_SECONDS.labels("tts-stream").observe(duration)
+    print(f"TTS stream: {sent} bytes of {fmt} in {duration:.1f}s", flush=True)
+
+@app.post("/tts")
+async def text_to_speech(
+    text: str = Form(...),
+    speaker: str = Form(None),
+    audio_format: str = Form("wav", alias="format"),
+    stream: bool = Form(False)
+):
+    text = text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Text is empty")
+    if len(text) > TTS_MAX_CHARS:
+        raise HTTPException(status_code=400, detail=f"Text is longer than {TTS_MAX_CHARS} characters")
+    if not tts_model.loaded:
+        raise HTTPException(status_code=503, detail="TTS model is not loaded")
+    if speaker and speaker not in tts_model.speakers:
+        raise HTTPException(status_code=400, detail=f"Unknown speaker {speaker!r}, available: {sorted(tts_model.speakers)}")
+    try:
+        audio_encode.check_format(audio_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if stream:
+        # เริ่มเล่นได้หลังประโยคแรก ไม่ต้องรอทั้งตอน
+        return StreamingResponse(
+            stream_speech(text, speaker, audio_format), media_type=audio_encode.media_type(audio_format)
+        )
+
+    start_time = time.perf_counter()
+    try:
+        with metrics.timed("tts"):
+            pcm, counts = await run_in_threadpool(synthesizer.synthesize, text, speaker)
+    except TTSUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    duration = time.perf_counter() - start_time
+    metrics.REQUEST_SECONDS.labels("tts").observe(duration)
+    audio_seconds = len(pcm) / 2 / tts_model.sample_rate
+    with metrics.timed("encode"):
+        if audio_format == "wav":
+            audio = wav_bytes(pcm, tts_model.sample_rate)
+        else:
+            audio = await run_in_threadpool(audio_encode.encode_audio, pcm, audio_format, tts_model.sample_rate)
+    return Response(
+        content=audio,
+        media_type=audio_encode.media_type(audio_format),
+        headers={
+            "X-Audio-Seconds": f"{audio_seconds:.2f}",
+            "X-Processing-Seconds": f"{duration:.2f}",
+            "X-Real-Time-Factor": f"{duration / audio_seconds:.3f}" if audio_seconds else "0",
+            "X-TTS-Units": str(counts["units"]),
+            "X-TTS-Cached": str(counts["cached"]),
+        },
+    )
+
+@app.get("/tts/speakers")
+def tts_speakers():
+    return {**tts_model.status(), "processes": synthesizer.processes, "cache": tts_cache.stats()}
+
+@app.get("/ollama/instances")
+def ollama_instances():
+    return {"instances": ollama.status(), "scheduler": ollama.scheduler.status()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    data, content_type = metrics.render()
+    return Response(content=data, media_type=content_type)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return llm_cache.stats()
+
 @app.get("/")
 def root():
     return "server is worked 111"
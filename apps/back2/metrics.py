@@ -0,0 +1,152 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# บันทึกเวลาแต่ละขั้น (upload, extract, clean, queue_wait, llm, ...) ทั้งใน Prometheus
+# และใน breakdown ของ request ปัจจุบันที่ส่งกลับไปใน response
+
+STAGE_SECONDS = Histogram(
+    "back2_stage_seconds", "Time spent per pipeline stage, per page or call",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+REQUEST_SECONDS = Histogram(
+    "back2_request_seconds", "End-to-end time of a processing request",
+    ["endpoint"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+PAGES_EXTRACTED = Counter("back2_pages_extracted_total", "Pages whose text was extracted from a PDF")
+LLM_CALLS = Counter("back2_llm_calls_total", "Ollama calls", ["kind", "outcome"])
+LLM_TOKENS = Counter("back2_llm_tokens_total", "Tokens reported by Ollama", ["kind", "phase"])
+LLM_TOKENS_PER_SECOND = Histogram(
+    "back2_llm_tokens_per_second", "Generation speed from eval_count / eval_duration",
+    ["kind"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 400),
+)
+
+
+class Breakdown:
+    """Per-request totals of stage time and LLM tokens.
+
+    Stages overlap (extraction runs while the LLM works on earlier pages),
+    so stage seconds add up to more than the wall time in `total`.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.eval_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, count: int = 1):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += count
+
+    def add_llm(self, prompt_tokens: int, eval_tokens: int, eval_seconds: float):
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.eval_tokens += eval_tokens
+            self.eval_seconds += eval_seconds
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.started, 3),
+                "stages": {
+                    stage: {"seconds": round(seconds, 3), "count": count}
+                    for stage, (seconds, count) in self.stages.items()
+                },
+                "llm": {
+                    "calls": self.llm_calls,
+                    "prompt_tokens": self.prompt_tokens,
+                    "eval_tokens": self.eval_tokens,
+                    "tokens_per_second": round(self.eval_tokens / self.eval_seconds, 1) if self.eval_seconds else None,
+                },
+            }
+
+
+_current = contextvars.ContextVar("breakdown", default=None)
+
+
+def start_breakdown() -> Breakdown:
+    breakdown = Breakdown()
+    _current.set(breakdown)
+    return breakdown
+
+
+def use_breakdown(breakdown: Breakdown):
+    _current.set(breakdown)
+
+
+def record(stage: str, seconds: float, count: int = 1):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    breakdown = _current.get()
+    if breakdown is not None:
+        breakdown.add(stage, seconds, count)
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def record_llm(kind: str, result: dict, seconds: float):
+    """Record one successful Ollama call from its response fields."""
+    record("llm", seconds)
+    LLM_CALLS.labels(kind, "ok").inc()
+    prompt_tokens = result.get("prompt_eval_count") or 0
+    eval_tokens = result.get("eval_count") or 0
+    eval_seconds = (result.get("eval_duration") or 0) / 1e9
+    LLM_TOKENS.labels(kind, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(kind, "eval").inc(eval_tokens)
+    if eval_tokens and eval_seconds:
+        LLM_TOKENS_PER_SECOND.labels(kind).observe(eval_tokens / eval_seconds)
+    breakdown = _current.get()
+    if breakdown is not None:
+        breakdown.add_llm(prompt_tokens, eval_tokens, eval_seconds)
+
+
+def record_llm_error(kind: str, seconds: float):
+    record("llm", seconds)
+    LLM_CALLS.labels(kind, "error").inc()
+
+
+def record_pages_extracted(count: int = 1):
+    PAGES_EXTRACTED.inc(count)
+
+
+def throughput(summary: dict, stages) -> dict:
+    """Items, busy seconds, items per busy second and share of wall time per stage.
+
+    `summary` is `Breakdown.as_dict()`. A stage whose busy share is close to
+    its parallelism is the one holding the others back.
+    """
+    wall = summary["total_seconds"] or 1e-9
+    result = {}
+    for stage in stages:
+        entry = summary["stages"].get(stage, {"seconds": 0.0, "count": 0})
+        seconds, count = entry["seconds"], entry["count"]
+        result[stage] = {
+            "items": count,
+            "busy_seconds": seconds,
+            "items_per_second": round(count / seconds, 2) if seconds else None,
+            "busy_share": round(seconds / wall, 3),
+        }
+    return result
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,334 @@
+import atexit
+import gc
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+
+# ส่วนบนของหน้าที่ถือเป็น header (ใช้หา "ตอนที่")
+HEADER_FRACTION = 0.2
+
+DEFAULT_BACKEND = os.environ.get("PDF_BACKEND", "pdfplumber")
+DEFAULT_PROCESSES = int(os.environ.get("PDF_PROCESSES", str(min(4, os.cpu_count() or 1))))
+CHUNK_PAGES = int(os.environ.get("PDF_CHUNK_PAGES", "8"))
+# เพดาน RSS ต่อ process (MB, 0 = ไม่จำกัด): เกินแล้วยกเลิกงาน PDF นั้น แทนที่จะให้ทั้ง worker โดน OOM kill
+MEMORY_LIMIT_MB = int(os.environ.get("PDF_MEMORY_LIMIT_MB", "0"))
+# PDFium เก็บ object ที่ parse แล้วไว้กับ document จนกว่าจะปิดไฟล์ จึงเปิดใหม่ทุก ๆ กี่หน้า
+PDFIUM_REOPEN_PAGES = int(os.environ.get("PDFIUM_REOPEN_PAGES", "16"))
+# PDFium ไม่ thread-safe แม้จะเป็นคนละ PdfDocument: ทุกการเรียก pypdfium2 ใน process เดียวกันต้องผ่าน lock นี้
+_PDFIUM_LOCK = threading.Lock()
+
+
+class MemoryLimitError(MemoryError):
+    pass
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def check_memory(limit_mb: int = None):
+    """Raise MemoryLimitError if this process is over the RSS ceiling even after a GC pass."""
+    limit_mb = MEMORY_LIMIT_MB if limit_mb is None else limit_mb
+    if not limit_mb:
+        return
+    rss = rss_mb()
+    if rss is None or rss <= limit_mb:
+        return
+    gc.collect()
+    rss = rss_mb()
+    if rss > limit_mb:
+        raise MemoryLimitError(f"PDF extraction stopped: process uses {rss:.0f} MB, limit is {limit_mb} MB")
+
+
+def _release_pdfminer_page(document, page):
+    # pdfminer เก็บทุก object ที่ parse แล้ว (รวม stream รูปภาพ) ไว้ใน document
+    # และ PDFPage เก็บ content stream ที่ decode แล้ว ตลอดอายุไฟล์: ทิ้งไป ถ้าต้องใช้อีกค่อย parse ใหม่
+    # ใช้ attribute ภายในของ pdfminer.six (ตรึงเวอร์ชันไว้ใน requirements.txt) เวอร์ชันที่ไม่มีก็แค่ไม่ได้คืน memory
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+    for name in ("_cached_objs", "_parsed_objs"):
+        cache = getattr(document, name, None)
+        if isinstance(cache, dict):
+            cache.clear()
+    contents = getattr(page, "attrs", {}).get("Contents")
+    decoded = getattr(page, "contents", None)
+    if isinstance(contents, PDFObjRef) and isinstance(decoded, list) and len(decoded) == 1 \
+            and isinstance(decoded[0], PDFStream):
+        page.contents = [contents]
+
+
+def _release_plumber_page(page):
+    # Page.close() ของ pdfplumber รุ่นใหม่ล้าง cache ของหน้านั้นเอง; 0.9 ยังไม่มี จึงล้างเฉพาะของ instance นี้:
+    # get_textmap เป็น lru_cache ที่สร้างต่อ page และอ้างกลับถึง page (วนกัน รอ gc รอบใหญ่กว่าจะคืน memory)
+    close = getattr(page, "close", None)
+    if close is not None:
+        close()
+        return
+    page.flush_cache()
+    textmap = vars(page).get("get_textmap")
+    if textmap is not None:
+        textmap.cache_clear()
+
+
+class PlumberBackend:
+    """pdfplumber: the original extraction, pure Python and the slowest."""
+
+    def __init__(self, source):
+        import pdfplumber
+        from pdfminer.pdfpage import PDFPage
+
+        self.pdf = pdfplumber.open(source)
+        # ไม่ใช้ pdf.pages: pdfplumber เก็บ Page ทุกหน้าพร้อม layout / textmap ที่ cache ไว้จนปิดไฟล์
+        self.page_objs = list(PDFPage.create_pages(self.pdf.doc))
+        self.page_count = len(self.page_objs)
+
+    def extract(self, index: int, body: bool, header: bool):
+        from pdfplumber.page import Page
+
+        # Page ใหม่ทุกครั้ง ใช้เสร็จก็ทิ้งไปทั้งก้อนพร้อม cache ของมัน
+        page = Page(self.pdf, self.page_objs[index], page_number=index + 1)
+        text = page.extract_text() if body else None
+        header_text = None
+        if header:
+            crop = page.crop((0, 0, page.width, page.height * HEADER_FRACTION))
+            header_text = crop.extract_text()
+            _release_plumber_page(crop)
+        _release_plumber_page(page)
+        _release_pdfminer_page(self.pdf.doc, page.page_obj)
+        return text, header_text
+
+    def close(self):
+        self.pdf.close()
+
+
+class PdfiumBackend:
+    """pypdfium2: PDFium's native text layer, much faster than pdfminer.
+
+    PDFium is not thread-safe, so calls from every instance in a process are
+    serialized on one lock; the process pool is what runs pages in parallel.
+    """
+
+    def __init__(self, source):
+        import pypdfium2
+        self.source = source
+        with _PDFIUM_LOCK:
+            self.pdf = pypdfium2.PdfDocument(source)
+            self.page_count = len(self.pdf)
+        self.pages_since_open = 0
+
+    def extract(self, index: int, body: bool, header: bool):
+        with _PDFIUM_LOCK:
+            return self._extract(index, body, header)
+
+    def _extract(self, index: int, body: bool, header: bool):
+        import pypdfium2
+
+        if PDFIUM_REOPEN_PAGES and self.pages_since_open >= PDFIUM_REOPEN_PAGES:
+            self.pdf.close()
+            if hasattr(self.source, "seek"):
+                self.source.seek(0)
+            self.pdf = pypdfium2.PdfDocument(self.source)
+            self.pages_since_open = 0
+        self.pages_since_open += 1
+        page = self.pdf[index]
+        try:
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range().replace("\r\n", "\n") if body else None
+                header_text = None
+                if header:
+                    width, height = page.get_size()
+                    # พิกัด PDF เริ่มจากมุมล่างซ้าย
+                    header_text = textpage.get_text_bounded(
+                        left=0, bottom=height * (1 - HEADER_FRACTION), right=width, top=height
+                    ).replace("\r\n", "\n")
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+        return text, header_text
+
+    def close(self):
+        with _PDFIUM_LOCK:
+            self.pdf.close()
+
+
+class PdfminerBackend:
+    """pdfminer.six without layout analysis; chars are grouped into lines here.
+
+    pdfminer's LAParams line grouping breaks Thai lines apart at zero-width
+    combining marks, and the box ordering is the slowest part of it, so this
+    backend asks for raw LTChar objects and groups them by baseline the way
+    pdfplumber does, minus pdfplumber's object wrapping.
+    """
+
+    # ระยะ (pt) ที่ถือว่าอยู่บรรทัดเดียวกัน / ห่างพอจะใส่ช่องว่าง ใช้ค่าเดียวกับ pdfplumber
+    Y_TOLERANCE = 3
+    X_TOLERANCE = 3
+
+    def __init__(self, source):
+        from pdfminer.converter import PDFPageAggregator
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser
+
+        self.file = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+        document = self.document = PDFDocument(PDFParser(self.file))
+        self.pages = list(PDFPage.create_pages(document))
+        self.page_count = len(self.pages)
+        self.device = PDFPageAggregator(PDFResourceManager(caching=True), laparams=None)
+        self.interpreter = PDFPageInterpreter(self.device.rsrcmgr, self.device)
+
+    def _lines(self, chars):
+        lines = []
+        for char in sorted(chars, key=lambda c: (-c.y1, c.x0)):
+            if lines and abs(lines[-1][0] - char.y1) <= self.Y_TOLERANCE:
+                lines[-1][1].append(char)
+            else:
+                lines.append((char.y1, [char]))
+        for top, line in lines:
+            line.sort(key=lambda c: c.x0)
+            parts = [line[0].get_text()]
+            for prev, char in zip(line, line[1:]):
+                if char.x0 - prev.x1 > self.X_TOLERANCE and " " not in (parts[-1], char.get_text()):
+                    parts.append(" ")
+                parts.append(char.get_text())
+            yield top, "".join(parts)
+
+    def extract(self, index: int, body: bool, header: bool):
+        from pdfminer.layout import LTChar
+
+        page = self.pages[index]
+        self.interpreter.process_page(page)
+        layout = self.device.get_result()
+        _release_pdfminer_page(self.document, page)
+        lines = list(self._lines(item for item in layout if isinstance(item, LTChar)))
+        text = "\n".join(line for _, line in lines) if body else None
+        header_text = None
+        if header:
+            # y1 นับจากล่างขึ้นบน: header คือบรรทัดที่อยู่ใน 20% บนสุด
+            bottom = layout.y1 - layout.height * HEADER_FRACTION
+            header_text = "\n".join(line for top, line in lines if top >= bottom)
+        return text, header_text
+
+    def close(self):
+        self.file.close()
+
+
+BACKENDS = {
+    "pdfplumber": PlumberBackend,
+    "pypdfium2": PdfiumBackend,
+    "pdfminer": PdfminerBackend,
+}
+
+
+def open_backend(source, backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](source)
+
+
+def _extract_chunk(path: str, backend: str, page_nums: list, body: bool, header: bool):
+    # รันใน process ลูก: เปิดไฟล์เองจาก path แล้วอ่านเฉพาะหน้าในช่วงที่ได้รับ
+    pdf = open_backend(path, backend)
+    try:
+        results = []
+        for page_num in page_nums:
+            results.append((page_num, *pdf.extract(page_num - 1, body, header)))
+            check_memory()
+        return results
+    finally:
+        pdf.close()
+
+
+_pool = None
+
+
+def get_pool(processes: int) -> ProcessPoolExecutor:
+    # สร้าง pool ครั้งเดียวต่อ process แล้วใช้ร่วมกันทุก request
+    # ใช้ spawn เพราะ fork จาก process ที่มี thread (uvicorn, threadpool) อาจค้างได้
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class PdfExtractor:
+    """Raw text of a PDF's pages, split across a process pool when it pays off.
+
+    `source` is a path or the PDF bytes; prefer a path, the file is then read
+    on demand instead of being held in memory. With `processes > 1` page
+    ranges are sent in chunks of `chunk_pages` to worker processes that open
+    the file by path (bytes are spooled to a temp file once); results always
+    come back in page order.
+
+    Parser caches are dropped after every page, and every process checks its
+    RSS against PDF_MEMORY_LIMIT_MB after each page (MemoryLimitError).
+    """
+
+    def __init__(self, source, backend: str = None, processes: int = None, chunk_pages: int = None):
+        self.backend = backend or DEFAULT_BACKEND
+        self.processes = DEFAULT_PROCESSES if processes is None else processes
+        self.chunk_pages = chunk_pages or CHUNK_PAGES
+        self._temp_path = None
+        if isinstance(source, (bytes, bytearray)):
+            if self.processes > 1:
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                    f.write(source)
+                self._temp_path = self.path = f.name
+            else:
+                self.path = None
+            self._bytes = bytes(source)
+        else:
+            self.path = os.fspath(source)
+            self._bytes = None
+        # เปิดใน process นี้ด้วยเสมอ (นับหน้า + ใช้อ่านเองเมื่อหน้าน้อย)
+        self._local = open_backend(self.path if self._bytes is None else io.BytesIO(self._bytes), self.backend)
+        self.page_count = self._local.page_count
+
+    def iter_extract(self, page_nums, body: bool = True, header: bool = False):
+        """Yield `(page_num, text, header_text)` for `page_nums` in order."""
+        page_nums = list(page_nums)
+        if self.processes <= 1 or len(page_nums) <= self.chunk_pages:
+            for page_num in page_nums:
+                page = (page_num, *self._local.extract(page_num - 1, body, header))
+                check_memory()
+                yield page
+            return
+
+        pool = get_pool(self.processes)
+        chunks = deque(page_nums[i:i + self.chunk_pages] for i in range(0, len(page_nums), self.chunk_pages))
+        pending = deque()
+        try:
+            while chunks or pending:
+                # ส่งงานล่วงหน้าไม่เกิน 2 chunk ต่อ process เพื่อจำกัดหน่วยความจำ
+                while chunks and len(pending) < self.processes * 2:
+                    pending.append(pool.submit(_extract_chunk, self.path, self.backend, chunks.popleft(), body, header))
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        self._local.close()
+        if self._temp_path is not None:
+            os.unlink(self._temp_path)
+            self._temp_path = None
+
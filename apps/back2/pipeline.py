@@ -0,0 +1,166 @@
+import asyncio
+import contextvars
+import threading
+from collections import deque
+
+_PIPELINE_DONE = object()
+
+def _extract_worker(extract, loop, pages: asyncio.Queue, slots: threading.Semaphore, stop: threading.Event, done):
+    # อ่าน + clean หน้าล่วงหน้าใน thread ของตัวเอง ระหว่างที่ Ollama กำลังแก้หน้าก่อนหน้าอยู่
+    # ไม่ใช้ default executor: ถ้า request พร้อมกันเท่าจำนวน thread ทุก thread จะเป็น extractor ที่รอคิวเต็ม
+    def put(item) -> bool:
+        while not stop.is_set():
+            if slots.acquire(timeout=0.5):
+                loop.call_soon_threadsafe(pages.put_nowait, item)
+                return True
+        return False
+
+    try:
+        for item in extract():
+            if not put(item):
+                break
+        else:
+            put(_PIPELINE_DONE)
+    except Exception as e:
+        put(e)
+    finally:
+        try:
+            loop.call_soon_threadsafe(_set_done, done)
+        except RuntimeError:
+            # loop ปิดไปแล้ว ไม่มีใครรอ
+            pass
+
+def _set_done(done: asyncio.Future):
+    if not done.done():
+        done.set_result(None)
+
+async def pipeline_pages(extract, correct, concurrency: int, on_result=None):
+    """Yield (page_num, result) from `extract` in page order.
+
+    `extract` is a plain generator function yielding (page_num, text) and runs
+    in a dedicated thread so pdfplumber never blocks the event loop. `correct` is
+    an async function applied to each text with at most `concurrency` calls in
+    flight. Pages whose text is None are passed through as None.
+
+    `on_result(page_num, result)` is awaited as soon as each page finishes,
+    before it is reordered, so callers can checkpoint out-of-order results.
+    """
+    loop = asyncio.get_running_loop()
+    lookahead = concurrency * 2
+    # หน้าที่ extract แล้วแต่ยังไม่ถูกอ่านไม่เกิน lookahead: thread รอ slot ส่วน loop อ่านจาก asyncio.Queue
+    pages = asyncio.Queue()
+    slots = threading.Semaphore(lookahead)
+    stop = threading.Event()
+    done = loop.create_future()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(page_num, text):
+        async with semaphore:
+            result = await correct(text) if text is not None else None
+        if on_result is not None:
+            await on_result(page_num, result)
+        return result
+
+    # thread ไม่ได้ contextvars ของ request มาเอง: copy ไปเพื่อให้ stage timing ลง request เดียวกัน
+    context = contextvars.copy_context()
+    extractor = threading.Thread(
+        target=context.run, args=(_extract_worker, extract, loop, pages, slots, stop, done), daemon=True
+    )
+    extractor.start()
+    pending = deque()
+    try:
+        while True:
+            item = await pages.get()
+            slots.release()
+            if item is _PIPELINE_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            page_num, text = item
+            if text is None and on_result is None:
+                task = None
+            else:
+                task = asyncio.create_task(bounded(page_num, text))
+            pending.append((page_num, task))
+            # ส่งผลลัพธ์ออกตามลำดับหน้า เมื่อคิวเต็มให้รอหน้าที่เก่าที่สุดก่อน
+            while pending and (len(pending) >= lookahead or _head_ready(pending)):
+                yield await _pop_result(pending)
+        while pending:
+            yield await _pop_result(pending)
+    finally:
+        stop.set()
+        for _, task in pending:
+            if task is not None:
+                task.cancel()
+        await done
+
+def _head_ready(pending: deque) -> bool:
+    task = pending[0][1]
+    return task is None or task.done()
+
+async def _pop_result(pending: deque):
+    page_num, task = pending.popleft()
+    return page_num, (await task if task is not None else None)
+
+
+class MicroBatcher:
+    """Collect single async requests into batches for one bulk call.
+
+    `submit(item)` resolves with that item's entry from `run_batch(items)`,
+    which is called once `max_batch` items are waiting or `max_delay`
+    seconds after the first item of a batch arrived. With `size` and
+    `max_size` a batch is also cut before the summed item sizes would
+    pass `max_size`.
+    """
+
+    def __init__(self, run_batch, max_batch: int, max_delay: float = 0.2, size=None, max_size: float = None):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.size = size
+        self.max_size = max_size
+        self.batches = 0
+        self._items = []
+        self._futures = []
+        self._size = 0
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        item_size = self.size(item) if self.size is not None else 0
+        if self.max_size is not None and self._items and self._size + item_size > self.max_size:
+            self._flush()
+        self._items.append(item)
+        self._futures.append(future)
+        self._size += item_size
+        if len(self._items) >= self.max_batch or (self.max_size is not None and self._size >= self.max_size):
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._items:
+            return
+        items, futures = self._items, self._futures
+        self._items, self._futures, self._size = [], [], 0
+        self.batches += 1
+        task = asyncio.create_task(self._run(items, futures))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items, futures):
+        try:
+            results = await self.run_batch(items)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
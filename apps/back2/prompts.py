@@ -0,0 +1,42 @@
+# Prompt ของงานแก้ข้อความ ใช้ร่วมกันระหว่าง main.py และ bench/prefix_bench.py
+
+# โหมด chat: คำสั่งอยู่ใน system message ที่เหมือนกันทุกครั้ง ให้ Ollama reuse KV cache ของ prefix นี้ได้
+CORRECTION_SYSTEM = (
+    "Correct the Thai vowel and tone mark encoding errors in the text the user sends. Rules:\n"
+    "1. Fix all 'sara-loi' (floating vowels) and misplaced tone marks to standard Thai grammar.\n"
+    "2. Maintain the original meaning and writing style.\n"
+    "3. If the text contains marker lines like <<<1>>>, copy every marker line unchanged, in the same order.\n"
+    "4. CRITICAL: Output ONLY the corrected text. Do not include any introduction, preamble, notes, or conclusion."
+)
+
+
+def correction_messages(text: str) -> list:
+    return [
+        {"role": "system", "content": CORRECTION_SYSTEM},
+        {"role": "user", "content": text},
+    ]
+
+
+def correction_prompt(text: str) -> str:
+    return (
+        f"Correct the Thai vowel and tone mark encoding errors in the text below. Rules:\n"
+        f"1. Fix all 'sara-loi' (floating vowels) and misplaced tone marks to standard Thai grammar.\n"
+        f"2. Maintain the original meaning and writing style.\n"
+        f"3. CRITICAL: Output ONLY the corrected text. Do not include any introduction, preamble, notes, or conclusion."
+        f"--- my text ---\n"
+        f"{text}\n"
+        f"Output ONLY the result."
+    )
+
+
+def packed_correction_prompt(packed: str, parts: int) -> str:
+    return (
+        f"Correct the Thai vowel and tone mark encoding errors in the text below. Rules:\n"
+        f"1. Fix all 'sara-loi' (floating vowels) and misplaced tone marks to standard Thai grammar.\n"
+        f"2. Maintain the original meaning and writing style.\n"
+        f"3. The text has {parts} parts, each starting with a marker line like <<<1>>>. Copy every marker line unchanged, in the same order.\n"
+        f"4. CRITICAL: Output ONLY the corrected text. Do not include any introduction, preamble, notes, or conclusion.\n"
+        f"--- my text ---\n"
+        f"{packed}\n"
+        f"Output ONLY the result."
+    )
@@ -0,0 +1,59 @@
+import re
+from collections import Counter
+
+# ชื่อเรื่อง / ชื่อผู้แต่ง / เลขหน้า ที่พิมพ์ซ้ำทุกหน้า อยู่ในกี่บรรทัดบนสุดและล่างสุดของหน้า
+EDGE_LINES = 3
+# บรรทัดต้องซ้ำในอย่างน้อยเท่านี้ของหน้าตัวอย่าง (และไม่น้อยกว่า MIN_PAGES หน้า) จึงนับเป็น running line
+MIN_RATIO = 0.4
+MIN_PAGES = 3
+
+_DIGITS_RE = re.compile(r'[0-9๐-๙]+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def line_key(line: str) -> str:
+    """Normalized form of a line: digits collapsed so "หน้า 12" and "หน้า 13" match."""
+    return _SPACE_RE.sub(' ', _DIGITS_RE.sub('#', line)).strip()
+
+
+def _edges(lines: list, edge_lines: int):
+    # (top, bottom): (index, line) ของบรรทัดที่ไม่ว่าง edge_lines บรรทัดแรกและสุดท้าย
+    filled = [(i, line) for i, line in enumerate(lines) if line.strip()]
+    split = min(edge_lines, (len(filled) + 1) // 2)
+    return filled[:split], filled[split:][-edge_lines:]
+
+
+def find_running_lines(pages: list, edge_lines: int = EDGE_LINES, min_ratio: float = MIN_RATIO,
+                       min_pages: int = MIN_PAGES) -> frozenset:
+    """Return the keys of lines repeated at the top or bottom of many pages."""
+    counts = Counter()
+    for text in pages:
+        top, bottom = _edges(text.split('\n'), edge_lines)
+        counts.update({line_key(line) for _, line in top + bottom})
+    threshold = max(min_pages, min_ratio * len(pages))
+    return frozenset(key for key, count in counts.items() if key and count >= threshold)
+
+
+def strip_running_lines(text: str, keys: frozenset, edge_lines: int = EDGE_LINES):
+    """Remove running lines from the edges of a page.
+
+    Returns `(body, removed)`; pass both to `restore_running_lines` to put
+    the removed lines back, the top ones before and the bottom ones after
+    the corrected body.
+    """
+    if not keys:
+        return text, ([], [])
+    lines = text.split('\n')
+    top, bottom = (
+        [(i, line) for i, line in zone if line_key(line) in keys] for zone in _edges(lines, edge_lines)
+    )
+    if not top and not bottom:
+        return text, ([], [])
+    drop = {i for i, _ in top + bottom}
+    body = '\n'.join(line for i, line in enumerate(lines) if i not in drop).strip('\n')
+    return body, ([line for _, line in top], [line for _, line in bottom])
+
+
+def restore_running_lines(body: str, removed) -> str:
+    top, bottom = removed
+    return '\n'.join(top + ([body] if body else []) + bottom)
@@ -6,36 +6,63 @@ import argparse
 logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger('test_pdf')
 
-def test_pdfplumber(pdf_path: str):
+def test_extract(pdf_path: str, backend: str, processes: int):
     try:
-        import pdfplumber
+        from pdf_extract import PdfExtractor
     except Exception as e:
-        logger.error('pdfplumber not installed: %s', e)
+        logger.error('PDF backend not installed: %s', e)
         return
 
     if not os.path.exists(pdf_path):
         logger.warning('PDF not found: %s', pdf_path)
         return
 
-    logger.info('Opening PDF: %s', pdf_path)
+    logger.info('Opening PDF: %s (backend=%s, processes=%d)', pdf_path, backend, processes)
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            num_pages = len(pdf.pages)
+        pdf = PdfExtractor(pdf_path, backend=backend, processes=processes)
+        try:
+            num_pages = pdf.page_count
             logger.info('Total pages: %d', num_pages)
 
             max_pages = min(5, num_pages)
             logger.info('Reading pages 1 to %d', max_pages)
-            for page_idx in range(max_pages):
-                page = pdf.pages[page_idx]
-                text = page.extract_text() or ''
-                clean_text = text.strip()
-                logger.info("\n=== PAGE %d ===\n%s\n", page_idx + 1, clean_text)
+            for page_num, text, _ in pdf.iter_extract(range(1, max_pages + 1)):
+                clean_text = (text or '').strip()
+                logger.info("\n=== PAGE %d ===\n%s\n", page_num, clean_text)
+        finally:
+            pdf.close()
     except Exception as e:
         logger.exception('Error reading PDF: %s', e)
 
+def test_normalizer():
+    # หน้าที่ขึ้นต้นด้วยสระ/วรรณยุกต์ลอย (sara-loi) ต้องถูกรายงานว่าน่าสงสัย ไม่ใช่ทำให้ request ล้ม
+    from thai_normalizer import analyze_thai, normalize_thai
+
+    # (ข้อความ, ผลหลัง normalize, valid, บรรทัดที่น่าสงสัย)
+    cases = [
+        ('ิกา ทดสอบ\nบรรทัดปกติ', 'ิกา ทดสอบ\nบรรทัดปกติ', False, [0]),
+        ('็ก', '็ก', False, [0]),
+        ('ก็ได้ ทดสอบ', 'ก็ได้ ทดสอบ', True, []),
+        # วรรณยุกต์หลังสระอำ -> ย้ายไปก่อนสระอำ
+        ('กำ่', 'ก่ำ', True, []),
+        ('น้ำ', 'น้ำ', True, []),
+        # วรรณยุกต์ลอยหลังช่องว่าง 2 ตัว -> ติดกับพยัญชนะตัวก่อน
+        ('ทดสอบ  ่ข', 'ทดสอบ่ข', True, []),
+    ]
+    for text, expected, valid, lines in cases:
+        normalized, _ = normalize_thai(text)
+        assert normalized == expected, f'normalize_thai({text!r}) = {normalized!r}, expected {expected!r}'
+        report = analyze_thai(normalized)
+        assert report.valid == valid and report.suspicious_lines == lines, \
+            f'analyze_thai({normalized!r}) = {report}, expected valid={valid} lines={lines}'
+    logger.info('Normalizer checks: %d passed', len(cases))
+
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Test PDF reading with pdfplumber')
+    parser = argparse.ArgumentParser(description='Test PDF reading with the extraction backends')
     parser.add_argument('--pdf', help='Path to PDF file', default='sample.pdf')
+    parser.add_argument('--backend', help='pdfplumber, pypdfium2 or pdfminer', default='pdfplumber')
+    parser.add_argument('--processes', help='Worker processes for extraction', type=int, default=1)
     args = parser.parse_args()
     
-    test_pdfplumber(args.pdf)
+    test_normalizer()
+    test_extract(args.pdf, args.backend, args.processes)
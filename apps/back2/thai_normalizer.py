@@ -0,0 +1,153 @@
+from typing import NamedTuple
+
+# แก้ VERSION ทุกครั้งที่เปลี่ยนกฎ เพื่อไม่ให้ใช้ checkpoint ที่ทำด้วยกฎเก่า
+VERSION = "1"
+
+# PUA glyph ที่ font ไทยเก่า ๆ ใช้แทนสระ/วรรณยุกต์ตัวลอยหรือตัวหลบหาง
+PUA_MAP = {
+    '\uf700': 'ฐ', '\uf701': 'ญ', '\uf702': 'ฐ', '\uf703': 'ญ',
+    '\uf704': 'ญ', '\uf705': 'ฐ', '\uf706': 'ญ', '\uf707': 'ฐ',
+    '\uf708': 'ญ', '\uf709': 'ญ', '\uf70a': '่', '\uf70b': '้',
+    '\uf70c': '๊', '\uf70d': '๋', '\uf70e': '์', '\uf70f': 'ํ',
+    '\uf710': 'ั', '\uf711': '็', '\uf712': 'ิ', '\uf713': 'ี',
+    '\uf714': 'ึ', '\uf715': 'ื', '\uf716': 'ุ', '\uf717': 'ู',
+    '\uf718': 'ุ', '\uf719': 'ู', '\uf71a': '็',
+}
+PUA_TABLE = str.maketrans(PUA_MAP)
+
+SARA_AA = 'า'
+SARA_AM = 'ำ'
+NIKHAHIT = 'ํ'
+SARA_E = 'เ'
+SARA_AE = 'แ'
+MAITAIKHU = '็'
+
+# ลำดับที่ถูกต้องภายใน 1 กลุ่มอักษร: พยัญชนะ -> สระบน/ล่าง -> วรรณยุกต์/ทัณฑฆาต -> นิคหิต
+_VOWEL_MARKS = frozenset('ัิีึื็ฺุู')
+_TONE_MARKS = frozenset('่้๊๋')
+_TOP_MARKS = frozenset('์๎')
+_MARK_RANK = {**{c: 0 for c in _VOWEL_MARKS}, **{c: 1 for c in _TONE_MARKS}, **{c: 1 for c in _TOP_MARKS}, NIKHAHIT: 2}
+_BASES = frozenset(chr(c) for c in range(0x0e01, 0x0e2f))
+
+
+def _is_mark(ch: str) -> bool:
+    return ch in _MARK_RANK
+
+
+def _flush_marks(out: list, marks: list) -> int:
+    """Append a run of combining marks in canonical order; return fixes made."""
+    if not marks:
+        return 0
+    ordered = []
+    for mark in sorted(marks, key=_MARK_RANK.__getitem__):
+        if not ordered or ordered[-1] != mark:
+            ordered.append(mark)
+    out.extend(ordered)
+    fixes = int(ordered != marks)
+    marks.clear()
+    return fixes
+
+
+def normalize_thai(text: str):
+    """Map PUA glyphs and reorder Thai combining marks in one scan.
+
+    Returns (normalized_text, fixes) where `fixes` counts the clusters that
+    had to be repaired (marks reordered, duplicated, detached by a space,
+    a tone mark after sara am, decomposed sara am or a doubled sara e).
+    """
+    if not text:
+        return "", 0
+    text = text.translate(PUA_TABLE)
+    out = []
+    marks = []
+    fixes = 0
+    pending_space = ""
+    for ch in text:
+        if _is_mark(ch):
+            if pending_space and out and (out[-1] in _BASES or _is_mark(out[-1])):
+                # สระ/วรรณยุกต์ลอยหลังช่องว่าง: เอาช่องว่างออกแล้วติดกับพยัญชนะตัวก่อน
+                pending_space = ""
+                fixes += 1
+            elif pending_space:
+                out.append(pending_space)
+                pending_space = ""
+            elif ch in _TONE_MARKS and not marks and len(out) > 1 and out[-1] == SARA_AM:
+                # วรรณยุกต์พิมพ์หลังสระอำ (กำ่) -> ย้ายไปไว้ก่อนสระอำ (ก่ำ) ตัวซ้ำทิ้ง
+                if out[-2] != ch:
+                    out.insert(len(out) - 1, ch)
+                fixes += 1
+                continue
+            marks.append(ch)
+            continue
+        if ch == ' ':
+            pending_space += ch
+            continue
+        if ch == SARA_AA and marks and NIKHAHIT in marks:
+            # นิคหิต + สระอา ที่ถูกแยกกัน -> สระอำ (วรรณยุกต์ต้องมาก่อนสระอำ)
+            marks.remove(NIKHAHIT)
+            _flush_marks(out, marks)
+            out.append(SARA_AM)
+            fixes += 1
+            continue
+        fixes += _flush_marks(out, marks)
+        if pending_space:
+            out.append(pending_space)
+            pending_space = ""
+        if ch == SARA_E and out and out[-1] == SARA_E:
+            out[-1] = SARA_AE
+            fixes += 1
+            continue
+        out.append(ch)
+    fixes += _flush_marks(out, marks)
+    out.append(pending_space)
+    return "".join(out), fixes
+
+
+class ThaiReport(NamedTuple):
+    valid: bool
+    confidence: float
+    clusters: int
+    suspicious_lines: list
+
+
+def analyze_thai(text: str) -> ThaiReport:
+    """Check already-normalized text for clusters the rules cannot repair.
+
+    A cluster is suspicious when a combining mark has no consonant to attach
+    to (sara-loi), carries two vowels or two tone marks, combines maitaikhu
+    with a tone mark, or when unmapped PUA / replacement characters remain.
+    """
+    suspicious = []
+    clusters = 0
+    bad_clusters = 0
+    for line_num, line in enumerate(text.split("\n")):
+        line_bad = False
+        has_base = False
+        vowels = tones = 0
+        maitaikhu = False
+        for ch in line:
+            if ch in _BASES:
+                clusters += 1
+                has_base = True
+                vowels = tones = 0
+                maitaikhu = False
+                continue
+            rank = _MARK_RANK.get(ch)
+            if rank is not None:
+                if rank == 0:
+                    vowels += 1
+                    maitaikhu = maitaikhu or ch == MAITAIKHU
+                elif ch in _TONE_MARKS:
+                    tones += 1
+                if not has_base or vowels > 1 or tones > 1 or (maitaikhu and tones):
+                    bad_clusters += 1
+                    line_bad = True
+                continue
+            if '\uf700' <= ch <= '\uf8ff' or ch == '\ufffd':
+                bad_clusters += 1
+                line_bad = True
+            has_base = False
+        if line_bad:
+            suspicious.append(line_num)
+    confidence = max(0.0, 1.0 - bad_clusters / max(clusters, 1))
+    return ThaiReport(not suspicious, round(confidence, 4), clusters, suspicious)
@@ -0,0 +1,173 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import wave
+
+# KhanomTan (VITS หลายผู้พูด/หลายภาษา) ที่ sound/khanomtan: โหลดครั้งเดียวตอน start แล้วใช้ซ้ำทุก request
+TTS_MODEL_DIR = os.environ.get("TTS_MODEL_DIR", "sound/khanomtan")
+TTS_LANGUAGE = os.environ.get("TTS_LANGUAGE", "th-th")
+TTS_DEFAULT_SPEAKER = os.environ.get("TTS_SPEAKER", "")
+# thread ของ torch ต่อการ synthesize หนึ่งครั้ง (ค่าเริ่มต้น = จำนวน core); interop thread ไม่ช่วยกับ VITS บน CPU
+TTS_THREADS = int(os.environ.get("TTS_THREADS", "0")) or os.cpu_count() or 1
+# ความยาวสูงสุดต่อ request (ราวหนึ่งตอน) ข้อความถูกตัดเป็นประโยคก่อนส่งเข้าโมเดลอยู่แล้ว (tts_engine.py)
+TTS_MAX_CHARS = int(os.environ.get("TTS_MAX_CHARS", "50000"))
+
+
+class TTSUnavailableError(RuntimeError):
+    """The TTS model is not loaded (missing torch/TTS or model files)."""
+
+
+class KhanomTanTTS:
+    """CPU-resident KhanomTan VITS model with its tokenizer and speaker list.
+
+    `load()` builds the model from `config.json`, loads `best_model.pth`
+    once and runs a short warm-up so the first request does not pay for
+    lazy initialisation. `synthesize` is thread-safe; calls are serialized
+    because each one already uses all `TTS_THREADS` torch threads.
+    """
+
+    def __init__(self, model_dir: str = None, language: str = None, threads: int = None):
+        self.model_dir = model_dir or TTS_MODEL_DIR
+        self.language = language or TTS_LANGUAGE
+        self.threads = threads or TTS_THREADS
+        self.model = None
+        self.tokenizer = None
+        self.sample_rate = None
+        self.hop_length = None
+        self.pad_id = 0
+        self._model_hash = None
+        self.speakers = {}
+        self.language_speaker = None
+        self.language_id = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self, warm_up: bool = True):
+        # import ตอนโหลดเท่านั้น: backend ที่ไม่ได้ติดตั้ง torch/TTS ยังใช้ส่วนแก้ PDF ได้ตามปกติ
+        import torch
+        from TTS.tts.configs.vits_config import VitsConfig
+        from TTS.tts.models.vits import Vits
+        from TTS.tts.utils.text.tokenizer import TTSTokenizer
+
+        started = time.perf_counter()
+        torch.set_num_threads(self.threads)
+        torch.set_num_interop_threads(1)
+
+        config = VitsConfig()
+        config.load_json(os.path.join(self.model_dir, "config.json"))
+        # path ใน config เป็น relative กับโฟลเดอร์โมเดล
+        for args in (config, config.model_args):
+            args.speakers_file = os.path.join(self.model_dir, "speakers.pth")
+            args.language_ids_file = os.path.join(self.model_dir, "language_ids.json")
+
+        self.tokenizer, config = TTSTokenizer.init_from_config(config)
+        model = Vits.init_from_config(config)
+        model.load_checkpoint(config, os.path.join(self.model_dir, "best_model.pth"), eval=True)
+        model.to("cpu")
+        self.model = model
+        self.sample_rate = config.audio.sample_rate
+        self.hop_length = config.audio.hop_length
+        self.pad_id = self.tokenizer.characters.pad_id
+        self.speakers = dict(model.speaker_manager.name_to_id)
+        # ผู้พูดของประโยคทดสอบภาษาเดียวกันใน config (ภาษาไทยคือ "Tsynctwo") เป็นค่าเริ่มต้น
+        self.language_speaker = next(
+            (s[1] for s in config.test_sentences if len(s) > 3 and s[3] == self.language and s[1] in self.speakers),
+            None,
+        )
+        self.language_id = model.language_manager.name_to_id[self.language]
+        if warm_up:
+            self.synthesize("ทดสอบ", self.default_speaker)
+        self.load_seconds = time.perf_counter() - started
+
+    @property
+    def default_speaker(self) -> str:
+        if TTS_DEFAULT_SPEAKER in self.speakers:
+            return TTS_DEFAULT_SPEAKER
+        return self.language_speaker or next(iter(self.speakers))
+
+    def speaker_id(self, speaker: str = None) -> int:
+        speaker = speaker or self.default_speaker
+        if speaker not in self.speakers:
+            raise KeyError(speaker)
+        return self.speakers[speaker]
+
+    @property
+    def model_hash(self) -> str:
+        """sha256 of the checkpoint and config, for keying cached audio."""
+        if self._model_hash is None:
+            digest = hashlib.sha256()
+            for name in ("config.json", "best_model.pth"):
+                with open(os.path.join(self.model_dir, name), "rb") as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(block)
+            self._model_hash = digest.hexdigest()
+        return self._model_hash
+
+    def token_ids(self, text: str) -> list:
+        return self.tokenizer.text_to_ids(text, language=self.language)
+
+    def synthesize(self, text: str, speaker: str = None):
+        """Return the waveform of `text` as a float32 numpy array."""
+        return self.synthesize_batch([self.token_ids(text)], speaker)[0]
+
+    def synthesize_batch(self, batch_ids: list, speaker: str = None) -> list:
+        """Run token id sequences through the model as one padded batch.
+
+        Returns one float32 waveform per sequence, trimmed to its own length;
+        sequences of similar length waste the least time on padding.
+        """
+        if not self.loaded:
+            raise TTSUnavailableError("TTS model is not loaded")
+        import torch
+
+        lengths = torch.tensor([len(ids) for ids in batch_ids], dtype=torch.long)
+        inputs = torch.full((len(batch_ids), int(lengths.max())), self.pad_id, dtype=torch.long)
+        for row, ids in enumerate(batch_ids):
+            inputs[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        aux_input = {
+            "x_lengths": lengths,
+            "speaker_ids": torch.full((len(batch_ids),), self.speaker_id(speaker), dtype=torch.long),
+            "language_ids": torch.full((len(batch_ids),), self.language_id, dtype=torch.long),
+        }
+        with self._lock, torch.inference_mode():
+            outputs = self.model.inference(inputs, aux_input=aux_input)
+        # ความยาวเสียงจริงของแต่ละแถว = จำนวน frame ใน y_mask x hop_length ส่วนที่เหลือคือ padding
+        samples = outputs["y_mask"].sum(dim=(1, 2)).long() * self.hop_length
+        waves = outputs["model_outputs"][:, 0, :]
+        return [waves[row, :int(samples[row])].numpy() for row in range(len(batch_ids))]
+
+    def status(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "model_dir": self.model_dir,
+            "language": self.language,
+            "threads": self.threads,
+            "sample_rate": self.sample_rate,
+            "speakers": sorted(self.speakers),
+            "default_speaker": self.default_speaker if self.speakers else None,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+        }
+
+
+def to_pcm16(samples) -> bytes:
+    """Float samples in [-1, 1] as 16-bit little-endian mono PCM."""
+    import numpy as np
+
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def wav_bytes(pcm: bytes, sample_rate: int) -> bytes:
+    """Wrap 16-bit mono PCM in a WAV header."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(pcm)
+    return buffer.getvalue()
@@ -0,0 +1,192 @@
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from chunking import split_text
+from llm_cache import LLMCache
+from tts import KhanomTanTTS, to_pcm16
+
+# หน่วยที่ส่งเข้าโมเดล: บรรทัด ตัดต่อที่ช่องว่าง (ภาษาไทยเว้นวรรคระหว่างประโยค/วลี) ให้ไม่เกินราว TTS_UNIT_TOKENS
+TTS_UNIT_TOKENS = int(os.environ.get("TTS_UNIT_TOKENS", "60"))
+# batch: ไม่เกิน TTS_BATCH_SIZE หน่วย และหน่วยยาวสุดไม่เกิน TTS_BUCKET_RATIO เท่าของสั้นสุด (padding น้อย)
+TTS_BATCH_SIZE = int(os.environ.get("TTS_BATCH_SIZE", "8"))
+TTS_BUCKET_RATIO = float(os.environ.get("TTS_BUCKET_RATIO", "1.5"))
+# process ลูกที่โหลดโมเดลของตัวเองตอน start (แบ่ง core กัน) ใช้เมื่อมี batch อย่างน้อย TTS_POOL_MIN_BATCHES
+TTS_PROCESSES = int(os.environ.get("TTS_PROCESSES", str(max(1, (os.cpu_count() or 1) // 4))))
+TTS_POOL_MIN_BATCHES = int(os.environ.get("TTS_POOL_MIN_BATCHES", "4"))
+# ตอน stream: หน่วยแรกสังเคราะห์เดี่ยว ๆ ให้เริ่มเล่นได้เร็ว หลังจากนั้นทำทีละ TTS_STREAM_WINDOW หน่วย
+TTS_STREAM_WINDOW = int(os.environ.get("TTS_STREAM_WINDOW", "32"))
+# ช่วงเงียบหลังวลี (เว้นวรรค) และหลังบรรทัด
+TTS_PHRASE_PAUSE = float(os.environ.get("TTS_PHRASE_PAUSE", "0.15"))
+TTS_LINE_PAUSE = float(os.environ.get("TTS_LINE_PAUSE", "0.4"))
+
+
+def split_units(text: str, max_tokens: int = None) -> list:
+    """Split text into `(unit, pause_seconds)` pairs for synthesis.
+
+    Every line is its own unit so repeated lines (chapter titles, narrator
+    tags) hit the cache; long lines are cut at spaces.
+    """
+    units = []
+    for line in text.splitlines():
+        pieces = [p.strip() for p in split_text(line, max_tokens or TTS_UNIT_TOKENS, (" ",)) if p.strip()]
+        for i, piece in enumerate(pieces):
+            units.append((piece, TTS_LINE_PAUSE if i == len(pieces) - 1 else TTS_PHRASE_PAUSE))
+    return units
+
+
+def length_buckets(lengths: list, max_batch: int = None, max_ratio: float = None) -> list:
+    """Group indexes of `lengths` into batches of similar length, shortest first."""
+    max_batch = max_batch or TTS_BATCH_SIZE
+    max_ratio = max_ratio or TTS_BUCKET_RATIO
+    batches, current = [], []
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        if current and (len(current) >= max_batch or lengths[index] > lengths[current[0]] * max_ratio):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+_worker_model = None
+_worker_barrier = None
+
+
+def _init_worker(model_dir: str, language: str, threads: int, barrier):
+    global _worker_model, _worker_barrier
+    _worker_barrier = barrier
+    _worker_model = KhanomTanTTS(model_dir, language, threads)
+    _worker_model.load()
+
+
+def _worker_ready() -> int:
+    # worker ทุกตัวรอกันที่นี่: งานเปล่า N งานจึงได้ worker คนละตัว และจบเมื่อทุกตัวโหลดโมเดลเสร็จแล้ว
+    _worker_barrier.wait()
+    return os.getpid()
+
+
+def _synthesize_batch(batch_ids: list, speaker: str) -> list:
+    # รันใน process ลูก: ส่งกลับเป็น PCM16 (ครึ่งหนึ่งของ float32 ตอนส่งข้าม process)
+    return [to_pcm16(wave) for wave in _worker_model.synthesize_batch(batch_ids, speaker)]
+
+
+_pool = None
+
+
+def get_pool(model: KhanomTanTTS, processes: int) -> ProcessPoolExecutor:
+    # สร้างครั้งเดียวต่อ process; แต่ละ worker โหลดโมเดลครั้งเดียวตอนเริ่ม
+    global _pool
+    if _pool is None:
+        context = multiprocessing.get_context("spawn")
+        _pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model.model_dir, model.language, max(1, model.threads // processes), context.Barrier(processes)),
+        )
+    return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class TTSCache(LLMCache):
+    """LLMCache for synthesized audio: values are PCM16 bytes, sized as stored."""
+
+    @staticmethod
+    def _size(value) -> int:
+        return len(value)
+
+
+class SpeechSynthesizer:
+    """Sentence-level synthesis with waveform caching and batching.
+
+    Text is split into units (`split_units`); units already in `cache`
+    (keyed by text, speaker, language and model hash) are reused, the rest
+    are synthesized once per distinct text in length-bucketed padded batches.
+    Inputs with at least TTS_POOL_MIN_BATCHES batches are spread over a
+    process pool of `processes` workers, each holding its own model loaded
+    by `start()`, while short inputs run on the resident model in this process.
+    """
+
+    def __init__(self, model: KhanomTanTTS, cache, processes: int = None):
+        self.model = model
+        self.cache = cache
+        self.processes = TTS_PROCESSES if processes is None else processes
+
+    def start(self):
+        """Start the process pool and load the model in every worker now, not on the first long input."""
+        if self.processes <= 1:
+            return
+        pool = get_pool(self.model, self.processes)
+        # spawn สร้าง worker ตามงานที่ค้าง: ส่งงานเปล่าเท่าจำนวน worker ให้ทุกตัวเริ่ม (และโหลดโมเดล) พร้อมกัน
+        pids = {future.result() for future in [pool.submit(_worker_ready) for _ in range(self.processes)]}
+        print(f"TTS pool ready: {len(pids)} worker processes", flush=True)
+
+    def _key(self, unit: str, speaker: str) -> str:
+        return self.cache.make_key("tts", self.model.model_hash, f"{self.model.language}:{speaker}", unit)
+
+    def _run_batches(self, batches: list, speaker: str) -> list:
+        if self.processes > 1 and len(batches) >= TTS_POOL_MIN_BATCHES:
+            pool = get_pool(self.model, self.processes)
+            futures = [pool.submit(_synthesize_batch, batch, speaker) for batch in batches]
+            return [future.result() for future in futures]
+        return [[to_pcm16(wave) for wave in self.model.synthesize_batch(batch, speaker)] for batch in batches]
+
+    def synthesize_units(self, units: list, speaker: str = None) -> tuple:
+        """PCM16 audio for each unit text, plus counts of cached and synthesized units."""
+        speaker = speaker or self.model.default_speaker
+        keys = [self._key(unit, speaker) for unit in units]
+        audio = {}
+        for unit, key in zip(units, keys):
+            if unit not in audio:
+                cached = self.cache.get("tts", key)
+                if cached is not None:
+                    audio[unit] = cached
+        cached_count = len(audio)
+
+        missing = [unit for unit in dict.fromkeys(units) if unit not in audio]
+        if missing:
+            token_ids = [self.model.token_ids(unit) for unit in missing]
+            buckets = length_buckets([len(ids) for ids in token_ids])
+            results = self._run_batches([[token_ids[i] for i in bucket] for bucket in buckets], speaker)
+            for bucket, pcms in zip(buckets, results):
+                for i, pcm in zip(bucket, pcms):
+                    audio[missing[i]] = pcm
+                    self.cache.put("tts", self._key(missing[i], speaker), pcm)
+        return [audio[unit] for unit in units], {"cached": cached_count, "synthesized": len(missing)}
+
+    def silence(self, seconds: float) -> bytes:
+        return b"\0\0" * int(seconds * self.model.sample_rate)
+
+    def synthesize(self, text: str, speaker: str = None) -> tuple:
+        """PCM16 audio of the whole text with pauses between units, plus unit counts."""
+        units = split_units(text)
+        pcms, counts = self.synthesize_units([unit for unit, _ in units], speaker)
+        audio = b"".join(pcm + self.silence(pause) for pcm, (_, pause) in zip(pcms, units))
+        return audio, {"units": len(units), **counts}
+
+    def iter_synthesize(self, text: str, speaker: str = None, window: int = None):
+        """Yield PCM16 audio unit by unit, in order, each with its trailing pause.
+
+        The first unit is synthesized on its own so playback can start
+        after one sentence; later units go in windows of `window` units,
+        large enough to batch and still keep ahead of playback.
+        """
+        units = split_units(text)
+        start, size = 0, 1
+        while start < len(units):
+            part = units[start:start + size]
+            pcms, _ = self.synthesize_units([unit for unit, _ in part], speaker)
+            for pcm, (_, pause) in zip(pcms, part):
+                yield pcm + self.silence(pause)
+            start += size
+            size = window or TTS_STREAM_WINDOW
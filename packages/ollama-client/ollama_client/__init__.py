@@ -0,0 +1,19 @@
+"""Pooled Ollama client shared by apps/back and apps/back2.
+
+Retries, keep_alive, per-instance circuit breakers and load balancing live
+in `client`; priority admission with per-client fairness in `scheduler`.
+"""
+
+from . import scheduler
+from .client import OLLAMA_NUM_CTX, PRESETS, CircuitBreaker, CircuitOpenError, OllamaClient, OllamaError, OllamaNode
+
+__all__ = [
+    "OLLAMA_NUM_CTX",
+    "PRESETS",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "OllamaClient",
+    "OllamaError",
+    "OllamaNode",
+    "scheduler",
+]
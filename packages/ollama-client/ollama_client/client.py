@@ -0,0 +1,443 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from .scheduler import INTERACTIVE, Scheduler
+
+# Ollama หลายเครื่องคั่นด้วย comma เช่น "http://gpu1:11434,http://gpu2:11434"
+OLLAMA_HOSTS = os.environ.get("OLLAMA_HOSTS", os.environ.get("OLLAMA_HOST", "http://localhost:11434"))
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "15"))
+# ให้ Ollama เก็บโมเดลไว้ใน memory ระหว่าง request (ไม่งั้นโหลดใหม่หลัง idle 5 นาที)
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_RETRIES = int(os.environ.get("OLLAMA_RETRIES", "3"))
+OLLAMA_BACKOFF = float(os.environ.get("OLLAMA_BACKOFF", "0.5"))
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "16"))
+# เปิด circuit หลังล้มเหลวติดกันกี่ครั้ง และปิดไว้นานกี่วินาทีก่อนลองใหม่
+OLLAMA_BREAKER_THRESHOLD = int(os.environ.get("OLLAMA_BREAKER_THRESHOLD", "5"))
+OLLAMA_BREAKER_RESET = float(os.environ.get("OLLAMA_BREAKER_RESET", "30"))
+# งานที่ส่งเข้า Ollama แต่ละเครื่องพร้อมกัน (เท่ากับ OLLAMA_NUM_PARALLEL ของเครื่อง) ที่เกินรอใน scheduler
+# และจำนวน slot รวมที่งาน bulk ใช้ไม่ได้ เก็บไว้ให้งาน interactive
+OLLAMA_CONCURRENCY = int(os.environ.get("OLLAMA_CONCURRENCY", "4"))
+OLLAMA_INTERACTIVE_RESERVE = int(os.environ.get("OLLAMA_INTERACTIVE_RESERVE", "1"))
+
+# context ของทุก preset ที่ใช้กับโมเดลเดียวกันต้องเท่ากัน: Ollama โหลด runner ใหม่ทุกครั้งที่ num_ctx เปลี่ยน
+OLLAMA_NUM_CTX = int(os.environ.get("OLLAMA_NUM_CTX", os.environ.get("LLM_NUM_CTX", "4096")))
+
+# options ของแต่ละงาน; ค่าที่ส่งมาตอนเรียกจะทับค่าใน preset (num_predict ส่งต่อครั้งได้ แต่อย่าส่ง num_ctx)
+PRESETS = {
+    "correction": {"num_ctx": OLLAMA_NUM_CTX},
+    "header": {"num_predict": 50, "temperature": 0.1, "num_ctx": OLLAMA_NUM_CTX},
+    "header-batch": {"temperature": 0, "num_ctx": OLLAMA_NUM_CTX},
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class OllamaError(Exception):
+    """Ollama could not be reached or kept failing after all retries."""
+
+
+class CircuitOpenError(OllamaError):
+    """Calls are refused because Ollama failed too many times in a row."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker of one Ollama instance, shared by the sync and async paths.
+
+    After `threshold` failures in a row the circuit opens and the instance is
+    skipped for `reset_after` seconds. After that it is half-open: every call
+    is let through, not a single probe. One success closes the circuit, one
+    more failure opens it for another period.
+    """
+
+    def __init__(self, threshold: int, reset_after: float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                return "half-open"
+            return "open"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def _model_name(name: str) -> str:
+    # Ollama เติม ":latest" ให้เองถ้าไม่ระบุ tag
+    return name if ":" in name else f"{name}:latest"
+
+
+class OllamaNode:
+    """One Ollama instance with its own breaker, in-flight count and health."""
+
+    def __init__(self, host: str, breaker: CircuitBreaker):
+        self.host = host.rstrip("/")
+        self.breaker = breaker
+        self.outstanding = 0
+        self.healthy = True
+        self.models = None
+        self.checked_at = None
+        self.requests = 0
+        self.errors = 0
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model is None or _model_name(model) in self.models
+
+    def update_health(self, tags: dict = None):
+        self.checked_at = time.time()
+        self.healthy = tags is not None
+        if tags is not None:
+            self.models = {_model_name(m["name"]) for m in tags.get("models", [])}
+
+    def status(self) -> dict:
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "models": sorted(self.models) if self.models is not None else None,
+            "checked_at": self.checked_at,
+        }
+
+
+class OllamaClient:
+    """Pooled, load-balanced Ollama HTTP client with retries and keep_alive.
+
+    `hosts` is a list (or comma separated string) of Ollama instances. Every
+    call goes to the healthy instance with the fewest requests in flight that
+    has the model; a failed call moves straight on to another instance, and
+    only when all of them have failed does it back off (full jitter) and go
+    round again, up to `retries` times. Each instance has its own circuit
+    breaker, and `check_health`/`acheck_health` refresh health and model
+    lists from /api/tags, the HTTP form of `ollama list`.
+
+    `generate` is for sync callers (apps/back), `agenerate` for asyncio code
+    (apps/back2). The async connection pool is created on first use so it
+    binds to the running event loop, and must be closed with `aclose()` there.
+
+    Every call first takes a slot from `scheduler` (see scheduler.py) with its
+    `priority`, "interactive" for short calls someone waits on and "bulk" for
+    page corrections.
+    """
+
+    def __init__(
+        self,
+        hosts=None,
+        keep_alive: str = None,
+        retries: int = None,
+        backoff: float = None,
+        max_connections: int = None,
+        breaker_threshold: int = None,
+        breaker_reset: float = None,
+        concurrency: int = None,
+        interactive_reserve: int = None,
+    ):
+        hosts = hosts or OLLAMA_HOSTS
+        if isinstance(hosts, str):
+            hosts = [h.strip() for h in hosts.split(",") if h.strip()]
+        self.nodes = [
+            OllamaNode(host, CircuitBreaker(
+                breaker_threshold or OLLAMA_BREAKER_THRESHOLD,
+                OLLAMA_BREAKER_RESET if breaker_reset is None else breaker_reset,
+            ))
+            for host in hosts
+        ]
+        self.keep_alive = OLLAMA_KEEP_ALIVE if keep_alive is None else keep_alive
+        self.retries = OLLAMA_RETRIES if retries is None else retries
+        self.backoff = OLLAMA_BACKOFF if backoff is None else backoff
+        connections = (max_connections or OLLAMA_MAX_CONNECTIONS) * len(self.nodes)
+        self.limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self.scheduler = Scheduler(
+            (concurrency or OLLAMA_CONCURRENCY) * len(self.nodes),
+            OLLAMA_INTERACTIVE_RESERVE if interactive_reserve is None else interactive_reserve,
+        )
+
+    def build_payload(self, model: str, prompt: str, preset: str = None, options: dict = None, **extra) -> dict:
+        return self._payload(model, {"prompt": prompt}, preset, options, extra)
+
+    def build_chat_payload(self, model: str, messages: list, preset: str = None, options: dict = None, **extra) -> dict:
+        return self._payload(model, {"messages": messages}, preset, options, extra)
+
+    def _payload(self, model: str, body: dict, preset: str, options: dict, extra: dict) -> dict:
+        payload = {"model": model, **body, "stream": False, "keep_alive": self.keep_alive}
+        merged = {**PRESETS.get(preset or "", {}), **(options or {})}
+        if merged:
+            payload["options"] = merged
+        payload.update(extra)
+        return payload
+
+    @staticmethod
+    def _timeout(timeout: float) -> httpx.Timeout:
+        # รอคำตอบได้นานตาม timeout ของงาน แต่เชื่อมต่อไม่ได้ใน 10 วินาทีให้ถือว่าล้มเหลวเลย
+        return httpx.Timeout(timeout, connect=min(timeout, 10))
+
+    def _delay(self, attempt: int) -> float:
+        # exponential backoff แบบ full jitter ไม่ให้ทุก request ยิงซ้ำพร้อมกัน
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    @staticmethod
+    def _failed(error: Exception) -> bool:
+        # 4xx แปลว่า Ollama ยังตอบได้ปกติ (เช่นไม่มีโมเดลนี้) ไม่นับเป็นความล้มเหลวของ server
+        # ส่วนคำตอบที่ไม่ใช่ JSON (ValueError) นับเหมือนการเชื่อมต่อล้มเหลว
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUS
+        return isinstance(error, (httpx.TransportError, ValueError))
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, ValueError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUS
+        # read timeout ของงานยาว ๆ ยิงซ้ำก็มักจะ timeout อีก
+        if isinstance(error, httpx.ReadTimeout):
+            return False
+        return isinstance(error, httpx.TransportError)
+
+    def _acquire(self, model: str, tried: set):
+        # least outstanding requests: เลือกเครื่องที่มีงานค้างน้อยที่สุด เท่ากันก็วนสลับกัน
+        with self._lock:
+            candidates = [n for n in self.nodes if n not in tried and n.breaker.state != "open"]
+            if not candidates:
+                return None
+            preferred = [n for n in candidates if n.healthy and n.serves(model)]
+            candidates = preferred or candidates
+            least = min(n.outstanding for n in candidates)
+            candidates = [n for n in candidates if n.outstanding == least]
+            node = candidates[next(self._turn) % len(candidates)]
+            node.outstanding += 1
+            node.requests += 1
+            return node
+
+    def _release(self, node: OllamaNode, error: Exception = None):
+        with self._lock:
+            node.outstanding -= 1
+            if error is not None and self._failed(error):
+                node.errors += 1
+                node.breaker.record_failure()
+            else:
+                node.breaker.record_success()
+
+    def _next_node(self, model: str, tried: set, attempt: int, error: Exception):
+        """Pick the node for the next try, or say how long to back off first.
+
+        Returns `(node, 0)`, `(None, delay)` when every node failed this call
+        and another round is allowed, and raises when the call has to give up.
+        """
+        node = self._acquire(model, tried)
+        if node is not None:
+            return node, 0
+        if not tried:
+            states = ", ".join(f"{n.host} ({n.breaker.failures} failures)" for n in self.nodes)
+            raise CircuitOpenError(f"Ollama circuit open on every instance: {states}")
+        if attempt >= self.retries:
+            raise error
+        tried.clear()
+        return None, self._delay(attempt)
+
+    @staticmethod
+    def _fail(error: Exception, node: OllamaNode, path: str):
+        if isinstance(error, httpx.HTTPStatusError):
+            detail = error.response.text[:200]
+            return OllamaError(f"Ollama {node.host}{path} returned {error.response.status_code}: {detail}")
+        if isinstance(error, ValueError):
+            return OllamaError(f"Ollama {node.host}{path} returned invalid JSON: {error}")
+        return OllamaError(f"Ollama {node.host}{path} failed: {error!r}")
+
+    def _sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(limits=self.limits)
+            return self._client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(limits=self.limits)
+        return self._async_client
+
+    def request(self, method: str, path: str, payload: dict = None, timeout: float = 120, priority: str = INTERACTIVE) -> dict:
+        # timeout นับตั้งแต่ได้ slot: เวลาที่รอใน scheduler ไม่ทำให้งานสั้น timeout
+        self.scheduler.acquire(priority)
+        try:
+            return self._request(method, path, payload, timeout)
+        finally:
+            self.scheduler.release(priority)
+
+    def _request(self, method: str, path: str, payload: dict, timeout: float) -> dict:
+        model = payload.get("model") if payload else None
+        content = None if payload is None else json.dumps(payload)
+        tried, attempt, error = set(), 0, None
+        while True:
+            node, delay = self._next_node(model, tried, attempt, error)
+            if node is None:
+                time.sleep(delay)
+                attempt += 1
+                continue
+            try:
+                response = self._sync_client().request(
+                    method, node.host + path,
+                    content=content,
+                    headers={"Content-Type": "application/json"},
+                    timeout=self._timeout(timeout),
+                )
+                response.raise_for_status()
+                result = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                self._release(node, e)
+                error = self._fail(e, node, path)
+                if not self._retryable(e):
+                    raise error from e
+                print(f"Ollama {node.host} failed ({e!r}), trying another instance", flush=True)
+                tried.add(node)
+                continue
+            except BaseException:
+                # KeyboardInterrupt / error อื่นที่ไม่ใช่ความผิดของ node: คืน slot โดยไม่นับเป็นความล้มเหลว
+                with self._lock:
+                    node.outstanding -= 1
+                raise
+            self._release(node)
+            return result
+
+    async def arequest(self, method: str, path: str, payload: dict = None, timeout: float = 120, priority: str = INTERACTIVE) -> dict:
+        await self.scheduler.aacquire(priority)
+        try:
+            return await self._arequest(method, path, payload, timeout)
+        finally:
+            self.scheduler.release(priority)
+
+    async def _arequest(self, method: str, path: str, payload: dict, timeout: float) -> dict:
+        model = payload.get("model") if payload else None
+        content = None if payload is None else json.dumps(payload)
+        tried, attempt, error = set(), 0, None
+        while True:
+            node, delay = self._next_node(model, tried, attempt, error)
+            if node is None:
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            try:
+                response = await self._get_async_client().request(
+                    method, node.host + path,
+                    content=content,
+                    headers={"Content-Type": "application/json"},
+                    timeout=self._timeout(timeout),
+                )
+                response.raise_for_status()
+                result = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                self._release(node, e)
+                error = self._fail(e, node, path)
+                if not self._retryable(e):
+                    raise error from e
+                print(f"Ollama {node.host} failed ({e!r}), trying another instance", flush=True)
+                tried.add(node)
+                continue
+            except BaseException:
+                # ถูก cancel ระหว่างรอ: คืน slot โดยไม่นับเป็นความล้มเหลว
+                with self._lock:
+                    node.outstanding -= 1
+                raise
+            self._release(node)
+            return result
+
+    def generate(self, prompt: str, model: str, preset: str = None, options: dict = None, timeout: float = 120,
+                 priority: str = INTERACTIVE, **extra) -> dict:
+        """POST /api/generate and return Ollama's JSON response."""
+        payload = self.build_payload(model, prompt, preset, options, **extra)
+        return self.request("POST", "/api/generate", payload, timeout, priority)
+
+    async def agenerate(self, prompt: str, model: str, preset: str = None, options: dict = None, timeout: float = 120,
+                        priority: str = INTERACTIVE, **extra) -> dict:
+        """Async POST /api/generate and return Ollama's JSON response."""
+        payload = self.build_payload(model, prompt, preset, options, **extra)
+        return await self.arequest("POST", "/api/generate", payload, timeout, priority)
+
+    def chat(self, messages: list, model: str, preset: str = None, options: dict = None, timeout: float = 120,
+             priority: str = INTERACTIVE, **extra) -> dict:
+        """POST /api/chat and return Ollama's JSON response."""
+        payload = self.build_chat_payload(model, messages, preset, options, **extra)
+        return self.request("POST", "/api/chat", payload, timeout, priority)
+
+    async def achat(self, messages: list, model: str, preset: str = None, options: dict = None, timeout: float = 120,
+                    priority: str = INTERACTIVE, **extra) -> dict:
+        """Async POST /api/chat and return Ollama's JSON response."""
+        payload = self.build_chat_payload(model, messages, preset, options, **extra)
+        return await self.arequest("POST", "/api/chat", payload, timeout, priority)
+
+    def check_health(self):
+        for node in self.nodes:
+            try:
+                response = self._sync_client().get(node.host + "/api/tags", timeout=5)
+                response.raise_for_status()
+                node.update_health(response.json())
+            except (httpx.HTTPError, ValueError):
+                node.update_health(None)
+
+    async def acheck_health(self):
+        async def check(node):
+            try:
+                response = await self._get_async_client().get(node.host + "/api/tags", timeout=5)
+                response.raise_for_status()
+                node.update_health(response.json())
+            except (httpx.HTTPError, ValueError):
+                node.update_health(None)
+
+        await asyncio.gather(*(check(node) for node in self.nodes))
+
+    async def run_health_checks(self, interval: float = None):
+        """Refresh every instance's health forever; run it as a task."""
+        while True:
+            await self.acheck_health()
+            unhealthy = [n.host for n in self.nodes if not n.healthy]
+            if unhealthy:
+                print(f"Ollama instances down: {', '.join(unhealthy)}", flush=True)
+            await asyncio.sleep(interval or OLLAMA_HEALTH_INTERVAL)
+
+    def list_models(self) -> list:
+        """Models available on the healthy instances, checking them first."""
+        self.check_health()
+        return sorted({m for n in self.nodes if n.healthy for m in n.models or ()})
+
+    def status(self) -> list:
+        with self._lock:
+            return [node.status() for node in self.nodes]
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
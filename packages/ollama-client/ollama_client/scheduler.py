@@ -0,0 +1,187 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+
+# ลำดับความสำคัญ: งานสั้นที่มีคนรอ (เช่น header) ก่อน งานแก้หน้ายาว ๆ ใช้ slot ที่เหลือ
+# scheduler มีผลเฉพาะใน process เดียวกัน: แต่ละ app ที่สร้าง OllamaClient เองก็มีคิวของตัวเอง
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+_current_client = contextvars.ContextVar("ollama_client_id", default="")
+
+
+def use_client(client_id: str):
+    """Attribute Ollama calls made from the current context to `client_id`."""
+    _current_client.set(client_id or "")
+
+
+def current_client() -> str:
+    return _current_client.get()
+
+
+class _Waiter:
+    __slots__ = ("priority", "client", "enqueued", "granted", "event", "future", "loop")
+
+    def __init__(self, priority: str, client: str):
+        self.priority = priority
+        self.client = client
+        self.enqueued = time.perf_counter()
+        self.granted = False
+        self.event = None
+        self.future = None
+        self.loop = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Scheduler:
+    """Admission control for Ollama calls with priority classes and per-client fairness.
+
+    At most `slots` calls are in flight; the rest wait here instead of in
+    Ollama's own FIFO queue, where a short call would sit behind every
+    correction sent before it. A free slot goes to the first class in
+    `PRIORITIES` order that has calls waiting, and within a class to the next
+    client in round-robin order, so one large job cannot starve other users. Bulk calls
+    never take the last `reserved` slots, which keeps room for an interactive
+    call without waiting for a multi-minute correction to finish.
+
+    Sync (`acquire`) and async (`aacquire`) callers share the same slots.
+    `on_wait(priority, seconds)` is called in the caller's context once a
+    slot is granted, for timing.
+    """
+
+    def __init__(self, slots: int, reserved: int = 1, on_wait=None):
+        self.slots = max(1, slots)
+        self.on_wait = on_wait
+        # slot เดียวจองไม่ได้: interactive ได้แค่แซงคิว
+        self.reserved = max(0, min(reserved, self.slots - 1))
+        self.running = {priority: 0 for priority in PRIORITIES}
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self.started = {priority: 0 for priority in PRIORITIES}
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def _can_start(self, priority: str) -> bool:
+        busy = sum(self.running.values())
+        if busy >= self.slots:
+            return False
+        return priority != BULK or self.running[BULK] < self.slots - self.reserved
+
+    def _start(self, waiter: _Waiter):
+        waiter.granted = True
+        self.running[waiter.priority] += 1
+        self.started[waiter.priority] += 1
+        self.wait_seconds[waiter.priority] += time.perf_counter() - waiter.enqueued
+
+    def _dispatch(self) -> list:
+        # เรียกขณะถือ lock; คืน waiter ที่ได้ slot ให้ปลุกหลังปล่อย lock
+        woken = []
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            while queues and self._can_start(priority):
+                client, waiters = next(iter(queues.items()))
+                waiter = waiters.popleft()
+                # round-robin: client ที่เพิ่งได้ไปต่อท้าย
+                del queues[client]
+                if waiters:
+                    queues[client] = waiters
+                self._start(waiter)
+                woken.append(waiter)
+            if queues:
+                # class นี้ยังมีคนรอ: class ที่สำคัญน้อยกว่าห้ามแซง
+                break
+        return woken
+
+    def _enqueue(self, waiter: _Waiter) -> bool:
+        """Start `waiter` right away if allowed, else queue it; True when started."""
+        with self._lock:
+            if not any(self._queues[p] for p in PRIORITIES[:PRIORITIES.index(waiter.priority) + 1]) \
+                    and self._can_start(waiter.priority):
+                self._start(waiter)
+                return True
+            self._queues[waiter.priority].setdefault(waiter.client, deque()).append(waiter)
+            return False
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up; True if it had already been granted a slot."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            queues = self._queues[waiter.priority]
+            waiters = queues.get(waiter.client)
+            if waiters is not None:
+                waiters.remove(waiter)
+                if not waiters:
+                    del queues[waiter.client]
+            woken = self._dispatch()
+        for other in woken:
+            other.wake()
+        return False
+
+    @staticmethod
+    def _check(priority: str):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {PRIORITIES}")
+
+    def acquire(self, priority: str = INTERACTIVE, client: str = None):
+        self._check(priority)
+        waiter = _Waiter(priority, current_client() if client is None else client)
+        waiter.event = threading.Event()
+        if not self._enqueue(waiter):
+            waiter.event.wait()
+        self._waited(waiter)
+
+    async def aacquire(self, priority: str = INTERACTIVE, client: str = None):
+        self._check(priority)
+        waiter = _Waiter(priority, current_client() if client is None else client)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        if not self._enqueue(waiter):
+            try:
+                await waiter.future
+            except BaseException:
+                # ถูก cancel ระหว่างรอ: ออกจากคิว หรือคืน slot ถ้าได้ไปแล้ว
+                if self._withdraw(waiter):
+                    self.release(priority)
+                raise
+        self._waited(waiter)
+
+    def _waited(self, waiter: _Waiter):
+        if self.on_wait is not None:
+            self.on_wait(waiter.priority, time.perf_counter() - waiter.enqueued)
+
+    def release(self, priority: str):
+        with self._lock:
+            self.running[priority] -= 1
+            woken = self._dispatch()
+        for waiter in woken:
+            waiter.wake()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "reserved_for_interactive": self.reserved,
+                "classes": {
+                    priority: {
+                        "running": self.running[priority],
+                        "queued": sum(len(w) for w in self._queues[priority].values()),
+                        "queued_clients": len(self._queues[priority]),
+                        "started": self.started[priority],
+                        "mean_wait_seconds": round(self.wait_seconds[priority] / self.started[priority], 3)
+                        if self.started[priority] else None,
+                    }
+                    for priority in PRIORITIES
+                },
+            }